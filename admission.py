@@ -0,0 +1,104 @@
+import ipaddress
+import time
+
+# Fixed-window counters keyed on packed address bytes. Entries from a
+# finished window are dropped on the next sweep, so the table only holds
+# addresses seen in the last window.
+class ExpiringCounter:
+    def __init__(self, window):
+        self.window = window
+        self.counts = {}
+        self.last_sweep = 0
+
+    def hit(self, key, now):
+        entry = self.counts.get(key)
+        if entry is None or now - entry[0] >= self.window:
+            self.counts[key] = (now, 1)
+            return 1
+        count = entry[1] + 1
+        self.counts[key] = (entry[0], count)
+        return count
+
+    def sweep(self, now):
+        if now - self.last_sweep < self.window:
+            return
+        self.last_sweep = now
+        expired = [key for key, entry in self.counts.items() if now - entry[0] >= self.window]
+        for key in expired:
+            del self.counts[key]
+
+    def __len__(self):
+        return len(self.counts)
+
+# Decides whether a new connection is accepted. Any limit set to 0 is off.
+# The per-host limits are off by default, local users and the bot all share
+# one loopback address.
+class AdmissionControl:
+    def __init__(self, max_connections=10000, max_per_ip=0, max_per_subnet=0,
+                 ip_rate=0, subnet_rate=0, rate_window=10, ipv4_prefix=24, ipv6_prefix=64):
+        self.max_connections = max_connections
+        self.max_per_ip = max_per_ip
+        self.max_per_subnet = max_per_subnet
+        self.ip_rate = ip_rate
+        self.subnet_rate = subnet_rate
+        self.ipv4_prefix_bytes = ipv4_prefix // 8
+        self.ipv6_prefix_bytes = ipv6_prefix // 8
+        self.connections = 0
+        self.per_ip = {}
+        self.per_subnet = {}
+        self.ip_attempts = ExpiringCounter(rate_window)
+        self.subnet_attempts = ExpiringCounter(rate_window)
+        self.accepted = 0
+        self.rejected = 0
+
+    def get_keys(self, host):
+        address = ipaddress.ip_address(host.split('%', 1)[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        packed = address.packed
+        prefix_bytes = self.ipv4_prefix_bytes if address.version == 4 else self.ipv6_prefix_bytes
+        return packed, packed[:prefix_bytes]
+
+    # Returns None when the connection is admitted, otherwise the reason
+    def admit(self, host, now=None):
+        now = now if now is not None else time.monotonic()
+        ip_key, subnet_key = self.get_keys(host)
+        self.ip_attempts.sweep(now)
+        self.subnet_attempts.sweep(now)
+
+        reason = None
+        if self.max_connections and self.connections >= self.max_connections:
+            reason = "Server full"
+        elif self.ip_rate and self.ip_attempts.hit(ip_key, now) > self.ip_rate:
+            reason = "Connecting too fast"
+        elif self.subnet_rate and self.subnet_attempts.hit(subnet_key, now) > self.subnet_rate:
+            reason = "Connecting too fast from your network"
+        elif self.max_per_ip and self.per_ip.get(ip_key, 0) >= self.max_per_ip:
+            reason = "Too many connections from your host"
+        elif self.max_per_subnet and self.per_subnet.get(subnet_key, 0) >= self.max_per_subnet:
+            reason = "Too many connections from your network"
+
+        if reason:
+            self.rejected += 1
+            return reason
+
+        self.accepted += 1
+        self.track(host)
+        return None
+
+    # Counts a connection without applying the limits
+    def track(self, host):
+        ip_key, subnet_key = self.get_keys(host)
+        self.connections += 1
+        self.per_ip[ip_key] = self.per_ip.get(ip_key, 0) + 1
+        self.per_subnet[subnet_key] = self.per_subnet.get(subnet_key, 0) + 1
+
+    def release(self, host):
+        ip_key, subnet_key = self.get_keys(host)
+        self.connections -= 1
+        for table, key in ((self.per_ip, ip_key), (self.per_subnet, subnet_key)):
+            count = table.get(key, 0) - 1
+            if count > 0:
+                table[key] = count
+            else:
+                table.pop(key, None)
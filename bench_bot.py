@@ -0,0 +1,172 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+
+from bot import Bot
+
+# A scripted IRC server on a local port. It accepts one bot, records every
+# line the bot sends with the time it arrived, and sends whatever traffic the
+# benchmark asks for, optionally cut into arbitrary pieces.
+class FakeIRCServer:
+    def __init__(self, host='::1'):
+        self.listener = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, 0))
+        self.listener.listen(1)
+        self.host = host
+        self.port = self.listener.getsockname()[1]
+        self.conn = None
+        self.received = []
+        self.condition = threading.Condition()
+
+    def accept(self, timeout=10):
+        self.listener.settimeout(timeout)
+        self.conn, _ = self.listener.accept()
+        self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(target=self.read_loop, daemon=True).start()
+
+    def read_loop(self):
+        buffer = b""
+        while True:
+            try:
+                data = self.conn.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            *lines, buffer = buffer.split(b"\r\n")
+            now = time.perf_counter()
+            with self.condition:
+                self.received.extend((now, line.decode()) for line in lines)
+                self.condition.notify_all()
+
+    def send(self, lines):
+        self.conn.sendall("".join(line + "\r\n" for line in lines).encode())
+
+    # Sends the lines cut at random byte offsets, pausing between pieces so
+    # the bot's recv returns them separately
+    def send_split(self, lines, pieces, pause=0.0005):
+        data = "".join(line + "\r\n" for line in lines).encode()
+        cuts = sorted(random.sample(range(1, len(data)), min(pieces, len(data) - 1)))
+        start = 0
+        for cut in cuts + [len(data)]:
+            self.conn.sendall(data[start:cut])
+            start = cut
+            time.sleep(pause)
+
+    def wait_for(self, predicate, start_index=0, timeout=30):
+        deadline = time.perf_counter() + timeout
+        with self.condition:
+            while True:
+                for index in range(start_index, len(self.received)):
+                    if predicate(self.received[index][1]):
+                        return index, self.received[index][0]
+                start_index = len(self.received)
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise TimeoutError("bot did not send the expected line")
+                self.condition.wait(remaining)
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+        self.listener.close()
+
+def start_bot(server):
+    bot = Bot(server.host, server.port, "BenchBot", "#bench", poll_journal=None)
+    threading.Thread(target=bot.connect, daemon=True).start()
+    server.accept()
+    server.wait_for(lambda line: line.startswith("JOIN #bench"))
+    return bot
+
+def measure_latency(server, commands):
+    latencies = []
+    for i in range(commands):
+        start_index = len(server.received)
+        start = time.perf_counter()
+        server.send([f":user{i}!u@host PRIVMSG #bench :!hello"])
+        _, replied_at = server.wait_for(lambda line: line == f"PRIVMSG #bench :Hello, user{i}!", start_index)
+        latencies.append(replied_at - start)
+    return sorted(latencies)
+
+def mixed_traffic(count):
+    templates = [
+        ":irc 353 BenchBot = #bench :BenchBot alice bob carol dave{i}",
+        ":alice!a@host PRIVMSG #bench :just chatting, message {i}",
+        ":irc 324 alice #bench +m bob",
+        ":alice!a@host MODE #bench +b troll{i}",
+        ":alice!a@host TOPIC #bench :topic number {i}",
+        ":bob!b@host PRIVMSG #bench :!unknowncommand {i}",
+    ]
+    return [templates[i % len(templates)].format(i=i) for i in range(count)]
+
+def measure_parse_rate(server, lines):
+    traffic = mixed_traffic(lines) + [":sentinel!s@host PRIVMSG #bench :!hello"]
+    start_index = len(server.received)
+    start = time.perf_counter()
+    server.send(traffic)
+    _, done_at = server.wait_for(lambda line: line == "PRIVMSG #bench :Hello, sentinel!", start_index)
+    return lines / (done_at - start)
+
+# Every command must get exactly one reply, in order, and the NAMES reply
+# must be parsed in full however the bytes were cut
+def check_split_reads(server, bot, commands, pieces):
+    names = ["BenchBot"] + [f"member{i}" for i in range(40)]
+    lines = [f":irc 353 BenchBot = #bench :{' '.join(names)}"]
+    lines += [f":split{i}!s@host PRIVMSG #bench :!hello" for i in range(commands)]
+    start_index = len(server.received)
+    server.send_split(lines, pieces)
+    try:
+        server.wait_for(lambda line: line == f"PRIVMSG #bench :Hello, split{commands - 1}!", start_index, timeout=5)
+    except TimeoutError:
+        # Reported below as replies missing
+        pass
+
+    with server.condition:
+        replies = [line for _, line in server.received[start_index:] if line.startswith("PRIVMSG #bench :Hello, split")]
+    expected = [f"PRIVMSG #bench :Hello, split{i}!" for i in range(commands)]
+    return {
+        'replies_in_order': replies == expected,
+        'names_parsed': bot.channel_members == names,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--commands', type=int, default=2000, help="commands for the latency run")
+    parser.add_argument('--lines', type=int, default=50000, help="lines of mixed traffic for the parse run")
+    parser.add_argument('--split-commands', type=int, default=500)
+    parser.add_argument('--split-pieces', type=int, default=2000)
+    parser.add_argument('--json', type=str, help="also write the report to this file")
+    args = parser.parse_args()
+
+    server = FakeIRCServer()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        bot = start_bot(server)
+        latencies = measure_latency(server, args.commands)
+        lines_per_s = measure_parse_rate(server, args.lines)
+        split = check_split_reads(server, bot, args.split_commands, args.split_pieces)
+    server.close()
+
+    report = {
+        'command_latency_us': {
+            'p50': round(statistics.median(latencies) * 1e6, 1),
+            'p99': round(latencies[int(len(latencies) * 0.99)] * 1e6, 1),
+            'max': round(latencies[-1] * 1e6, 1),
+        },
+        'lines_per_s': round(lines_per_s),
+        'split_reads': split,
+    }
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+    if not all(split.values()):
+        sys.exit(1)
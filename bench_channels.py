@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+import tracemalloc
+
+from server import Server
+from utils import Channel, ChannelRegistry, Client
+
+class NullWriter:
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+# Each channel name is used once: an operator and a user join it, the
+# operator bans someone and leaves, then kicks the user, which empties it.
+# Every 10th name is written in upper case so folding has something to do.
+def churn(table, names, op, user, release_on_kick):
+    for i in range(names):
+        name = f"#Churn{i}" if i % 10 else f"#CHURN{i}"
+        channel = table.get_or_create(name)
+        channel.join(op)
+        channel.join(user)
+        channel.ban_user(f"troll{i}")
+        channel.part(op)
+        table.release(channel)
+        channel.part(user)
+        if release_on_kick:
+            table.release(channel)
+
+# The table as it was before: a dict on the raw name. PART and QUIT dropped
+# a channel once it was empty, KICK never did.
+class OldChannelTable:
+    def __init__(self):
+        self.channels = {}
+
+    def get_or_create(self, name):
+        if name not in self.channels:
+            self.channels[name] = Channel(name)
+        return self.channels[name]
+
+    def release(self, channel):
+        if channel.is_empty():
+            del self.channels[channel.name]
+
+    def __len__(self):
+        return len(self.channels)
+
+def measure(table, names, release_on_kick=True):
+    op = Client(NullWriter(), "op", "op")
+    user = Client(NullWriter(), "churner", "churner")
+    tracemalloc.start()
+    start = time.perf_counter()
+    churn(table, names, op, user, release_on_kick)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'names': names, 'entries': len(table), 'retained': len(getattr(table, 'retained', ())),
+            'current_mb': current / 1e6, 'peak_mb': peak / 1e6, 'elapsed': elapsed}
+
+# Goes through the server's own KICK handler, which used to leave the
+# channel behind
+async def kick_churn(names):
+    server = Server('::1', 0)
+    op = Client(NullWriter(), "op", "op")
+    victim = Client(NullWriter(), "victim", "victim")
+    for client in (op, victim):
+        server.users[client.nickname] = client
+    for i in range(names):
+        name = f"#kick{i}"
+        server.join_channel(op, name)
+        server.join_channel(victim, name.upper())
+        server.part_channel(op, name)
+        server.kick_user(op, name, "victim")
+    await asyncio.sleep(0)
+    return len(server.channels)
+
+def report(label, result):
+    print(f"{label:>34}: {result['names']:8d} names, {result['entries']:8d} left in table, "
+          f"{result['retained']:6d} retained, {result['current_mb']:8.1f} MB held, "
+          f"peak {result['peak_mb']:6.2f} MB, {result['names'] / result['elapsed']:8.0f} names/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--names', type=int, default=1000000)
+    parser.add_argument('--baseline-names', type=int, default=100000,
+                        help="names for the old table, which grows by one channel per kick")
+    parser.add_argument('--register-every', type=int, default=100,
+                        help="register every Nth name for the retention run")
+    parser.add_argument('--kick-names', type=int, default=10000)
+    args = parser.parse_args()
+
+    baseline = measure(OldChannelTable(), args.baseline_names, release_on_kick=False)
+    report("old table, kick never releases", baseline)
+    scale = args.names / args.baseline_names
+    print(f"{'':>34}  extrapolated to {args.names} names: {baseline['current_mb'] * scale:.0f} MB")
+
+    report("registry", measure(ChannelRegistry(), args.names))
+
+    registered = [f"#churn{i}" for i in range(0, args.names, args.register_every)]
+    registry = ChannelRegistry(registered)
+    report(f"registry, 1 in {args.register_every} registered", measure(registry, args.names))
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        left = asyncio.run(kick_churn(args.kick_names))
+    print(f"{'server JOIN/KICK/PART':>34}: {args.kick_names:8d} names, {left:8d} left in table")
@@ -0,0 +1,73 @@
+import argparse
+import contextlib
+import os
+import threading
+import time
+
+from bot import Bot
+from commands import CommandRegistry
+
+# Stands in for the server connection so commands can be dispatched without
+# a running server
+class CountingSocket:
+    def __init__(self, expected):
+        self.expected = expected
+        self.lines = []
+        self.done = threading.Event()
+
+    def sendall(self, data):
+        self.lines.append(data)
+        if len(self.lines) >= self.expected:
+            self.done.set()
+
+def slow_handler(delay):
+    def handler(sender, command):
+        time.sleep(delay)
+        return f"PRIVMSG #bench :slow reply to {sender}"
+    return handler
+
+def run(commands, slow_every, delay, blocking, workers):
+    bot = Bot(None, None, "BenchBot", "#bench")
+    bot.commands = CommandRegistry(bot.send_message, max_workers=workers)
+    bot.register_commands()
+    handler = slow_handler(delay)
+    if blocking:
+        bot.commands.register('slow', handler, blocking=True)
+    else:
+        # Inline handlers send their own replies
+        bot.commands.register('slow', lambda sender, command: bot.send_message(handler(sender, command)))
+    bot.sock = CountingSocket(commands)
+
+    lines = []
+    for i in range(commands):
+        command = "slow" if slow_every and i % slow_every == 0 else "hello"
+        lines.append(f":user{i} PRIVMSG #bench :!{command}")
+
+    start = time.perf_counter()
+    dispatched = 0
+    for line in lines:
+        bot.handle_server_response(line)
+        dispatched += 1
+    dispatch_time = time.perf_counter() - start
+    bot.sock.done.wait()
+    total_time = time.perf_counter() - start
+    bot.commands.shutdown()
+    return dispatched / dispatch_time, commands / total_time
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--commands', type=int, default=2000)
+    parser.add_argument('--slow-every', type=int, default=10)
+    parser.add_argument('--delay', type=float, default=0.005)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    results = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for blocking in (False, True):
+            results.append((blocking, run(args.commands, args.slow_every, args.delay, blocking, args.workers)))
+
+    print(f"{args.commands} commands, 1 in {args.slow_every} sleeps {args.delay * 1000:.1f} ms, {args.workers} workers")
+    for blocking, (dispatch_rate, reply_rate) in results:
+        mode = "thread pool" if blocking else "inline"
+        print(f"{mode:>12}: dispatch {dispatch_rate:10.0f} cmd/s, replies {reply_rate:10.0f} cmd/s")
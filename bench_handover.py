@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+NO_LIMITS = ['--max-connections', '0', '--max-per-ip', '0', '--max-per-subnet', '0',
+             '--ip-rate', '0', '--subnet-rate', '0', '--registration-timeout', '600']
+
+def start_server(port, log_path, *extra):
+    log = open(log_path, 'w')
+    return subprocess.Popen([sys.executable, 'server.py', '--port', str(port), *NO_LIMITS, *extra],
+                            stdout=log, stderr=subprocess.STDOUT, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+# Only reads what was appended after offset, the logs get large
+async def wait_for_log(log_path, text, offset=0, timeout=120):
+    start = time.perf_counter()
+    with open(log_path) as log:
+        log.seek(offset)
+        pending = ""
+        while time.perf_counter() - start < timeout:
+            pending += log.read(1 << 16)
+            lines = pending.split("\n")
+            pending = lines.pop()
+            for line in lines:
+                if text in line:
+                    return line.strip()
+            if not lines:
+                await asyncio.sleep(0.01)
+    raise TimeoutError(f"'{text}' not seen in {log_path}")
+
+async def connect(port, nickname, channel):
+    reader, writer = await asyncio.open_connection('::1', port)
+    writer.write(f"NICK {nickname}\r\nUSER {nickname} 0 * :{nickname}\r\nJOIN {channel}\r\n".encode())
+    while b" 366 " not in await reader.readline():
+        pass
+    return reader, writer
+
+async def check_alive(reader, writer, channel):
+    writer.write(f"NAMES {channel}\r\n".encode())
+    try:
+        while True:
+            line = await asyncio.wait_for(reader.readline(), 30)
+            if not line:
+                return False
+            if b" 366 " in line:
+                return True
+    except (asyncio.TimeoutError, ConnectionError):
+        return False
+
+# Keeps asking for NAMES and records the longest wait for an answer
+async def probe(reader, writer, stop, gaps):
+    while not stop.is_set():
+        start = time.perf_counter()
+        writer.write(b"NAMES #probe\r\n")
+        while b" 366 " not in await reader.readline():
+            pass
+        gaps.append(time.perf_counter() - start)
+        await asyncio.sleep(0.002)
+
+async def main(args, workdir):
+    handover_path = os.path.join(workdir, "handover.sock")
+    old_log = os.path.join(workdir, "old.log")
+    new_log = os.path.join(workdir, "new.log")
+
+    old = start_server(args.port, old_log, '--handover-path', handover_path)
+    await wait_for_log(old_log, "Waiting for a replacement")
+
+    clients = []
+    for batch_start in range(0, args.clients, 500):
+        batch = range(batch_start, min(batch_start + 500, args.clients))
+        clients += await asyncio.gather(*(connect(args.port, f"user{i}", f"#chan{i % args.channels}") for i in batch))
+    print(f"{len(clients)} clients connected and registered")
+
+    probe_reader, probe_writer = await connect(args.port, "probe", "#probe")
+    stop = asyncio.Event()
+    gaps = []
+    probe_task = asyncio.create_task(probe(probe_reader, probe_writer, stop, gaps))
+    await asyncio.sleep(0.5)
+
+    old_log_offset = os.path.getsize(old_log)
+    new = start_server(args.port, new_log, '--takeover', handover_path)
+    handed_over = await wait_for_log(old_log, "Handed over", old_log_offset)
+    took_over = await wait_for_log(new_log, "Took over")
+    old.wait(timeout=30)
+    await asyncio.sleep(0.5)
+    stop.set()
+    await probe_task
+
+    results = await asyncio.gather(*(check_alive(reader, writer, f"#chan{i % args.channels}")
+                                     for i, (reader, writer) in enumerate(clients)))
+    new.terminate()
+    new.wait()
+
+    print(f"old process: {handed_over}")
+    print(f"new process: {took_over}")
+    print(f"longest NAMES round trip seen by a client during the restart: {max(gaps) * 1000:.1f} ms")
+    print(f"clients still served after the restart: {sum(results)}/{len(results)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=17200)
+    parser.add_argument('--clients', type=int, default=10000)
+    parser.add_argument('--channels', type=int, default=100)
+    args = parser.parse_args()
+
+    # Each side of every connection needs a descriptor
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        asyncio.run(main(args, workdir))
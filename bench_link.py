@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import time
+
+from server import Server
+from utils import Client
+
+# Accepts writes from Client.send for users that have no real connection
+class NullWriter:
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    def get_extra_info(self, name):
+        return None
+
+async def start_node(port, links=None):
+    server = Server('::1', port, f"node{port}", link_password="bench", links=links)
+    listener = await asyncio.start_server(server.handle_client, server.host, server.port)
+    for host, link_port in server.link_addresses:
+        asyncio.create_task(server.connect_link(host, link_port))
+    return server, listener
+
+async def stop_nodes(nodes):
+    for server, listener in nodes:
+        listener.close()
+        for link in list(server.links):
+            link.close()
+    await asyncio.sleep(0.1)
+
+async def wait_for(condition, timeout=120):
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError("condition not reached")
+        await asyncio.sleep(0.001)
+
+async def register(port, nickname, channel):
+    reader, writer = await asyncio.open_connection('::1', port)
+    writer.write(f"NICK {nickname}\r\nUSER {nickname} 0 * :{nickname}\r\nJOIN {channel}\r\n".encode())
+    await writer.drain()
+    while b"366" not in await reader.readline():
+        pass
+    return reader, writer
+
+async def measure_latency(base_port, messages):
+    nodes = [await start_node(base_port)]
+    for i in range(1, 3):
+        nodes.append(await start_node(base_port + i, [('::1', base_port + i - 1)]))
+    await wait_for(lambda: len(nodes[1][0].links) == 2)
+
+    _, alice = await register(base_port, "alice", "#bench")
+    bob_reader, bob = await register(base_port + 2, "bob", "#bench")
+    await wait_for(lambda: len(nodes[0][0].channels["#bench"].members) == 2)
+
+    latencies = []
+    for i in range(messages):
+        start = time.perf_counter()
+        alice.write(f"PRIVMSG #bench :message {i}\r\n".encode())
+        while b"PRIVMSG" not in await bob_reader.readline():
+            pass
+        latencies.append(time.perf_counter() - start)
+
+    alice.close()
+    bob.close()
+    await stop_nodes(nodes)
+    return latencies
+
+async def measure_burst(base_port, users, channels):
+    hub, hub_listener = await start_node(base_port + 10)
+    for i in range(users):
+        nickname = f"user{i}"
+        client = Client(NullWriter(), nickname, nickname)
+        client.nick_ts = time.time()
+        hub.clients[('fake', i)] = client
+        hub.nicknames.add(nickname)
+        hub.users[nickname] = client
+        hub.channels.get_or_create(f"#chan{i % channels}").join(client)
+
+    start = time.perf_counter()
+    leaf, leaf_listener = await start_node(base_port + 11, [('::1', base_port + 10)])
+    await wait_for(lambda: leaf.links and not leaf.links[0].bursting)
+    elapsed = time.perf_counter() - start
+
+    assert len(leaf.users) == users
+    assert sum(len(channel.members) for channel in leaf.channels.values()) == users
+    await stop_nodes([(hub, hub_listener), (leaf, leaf_listener)])
+    return elapsed
+
+async def main(args):
+    latencies = await measure_latency(args.port, args.messages)
+    burst_time = await measure_burst(args.port, args.users, args.channels)
+    return latencies, burst_time
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=17000)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--channels', type=int, default=500)
+    args = parser.parse_args()
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        latencies, burst_time = asyncio.run(main(args))
+
+    latencies.sort()
+    print(f"Cross-node PRIVMSG over 2 hops ({args.messages} messages): "
+          f"median {statistics.median(latencies) * 1000:.3f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.3f} ms")
+    print(f"Burst of {args.users} users in {args.channels} channels: {burst_time:.2f}s")
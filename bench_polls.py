@@ -0,0 +1,46 @@
+import argparse
+import os
+import tempfile
+import time
+
+from polls import PollManager, VOTE_OK
+
+def run(votes, polls, options, journal_path):
+    posted = []
+    manager = PollManager(lambda channel, message: posted.append(message), journal_path=journal_path,
+                          default_duration=3600, report_interval=0)
+    manager.start()
+    option_names = [f"Option {i}" for i in range(options)]
+    poll_ids = [manager.create(f"#chan{i % 4}", "bench", f"Question {i}", option_names).id for i in range(polls)]
+
+    # Votes arrive with the casing and spacing users actually type
+    ballots = [(poll_ids[i % polls], f"voter{i}", f"  OPTION {i % options} ") for i in range(votes)]
+
+    start = time.perf_counter()
+    for poll_id, voter, option in ballots:
+        status, _ = manager.vote(poll_id, voter, option)
+        assert status == VOTE_OK
+    elapsed = time.perf_counter() - start
+    manager.stop()
+
+    start = time.perf_counter()
+    restored = PollManager(lambda channel, message: None, journal_path=journal_path, report_interval=0)
+    restored.restore()
+    restore_time = time.perf_counter() - start
+    if journal_path:
+        assert sum(poll.total_votes() for poll in restored.polls.values()) == votes
+    return elapsed, restore_time
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--votes', type=int, default=200000)
+    parser.add_argument('--polls', type=int, default=50)
+    parser.add_argument('--options', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for journal_path in (None, os.path.join(tmp, "polls.journal")):
+            elapsed, restore_time = run(args.votes, args.polls, args.options, journal_path)
+            mode = "journaled" if journal_path else "in-memory"
+            print(f"{mode:>10}: {args.votes} votes over {args.polls} polls in {elapsed:.2f}s "
+                  f"= {args.votes / elapsed:,.0f} votes/s (target 10,000), restore {restore_time * 1000:.0f} ms")
@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+
+from admission import AdmissionControl
+from server import Server
+
+async def reconnect(port, nickname, results):
+    try:
+        reader, writer = await asyncio.open_connection('::1', port)
+    except OSError:
+        results['failed'] += 1
+        return
+    try:
+        writer.write(f"NICK {nickname}\r\nUSER {nickname} 0 * :{nickname}\r\n".encode())
+        while True:
+            line = await reader.readline()
+            if not line:
+                results['failed'] += 1
+                return
+            if line.startswith(b"ERROR"):
+                results['rejected'] += 1
+                return
+            if b" 001 " in line:
+                results['accepted'] += 1
+                return
+    except (ConnectionResetError, BrokenPipeError):
+        results['failed'] += 1
+    finally:
+        results['open'].append(writer)
+
+async def storm(port, clients, backlog, admission):
+    server = Server('::1', port, admission=admission, listen_backlog=backlog)
+    listener = await asyncio.start_server(server.handle_client, server.host, server.port, backlog=server.listen_backlog)
+
+    results = {'accepted': 0, 'rejected': 0, 'failed': 0, 'open': []}
+    start = time.perf_counter()
+    await asyncio.gather(*(reconnect(port, f"user{i}", results) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    for writer in results.pop('open'):
+        writer.close()
+    listener.close()
+    await asyncio.sleep(0.2)
+    return results, elapsed
+
+SCENARIOS = [
+    ("no per-host limits", dict(max_per_ip=0, max_per_subnet=0, ip_rate=0, subnet_rate=0)),
+    ("per-IP concurrent cap 500", dict(max_per_ip=500, max_per_subnet=0, ip_rate=0, subnet_rate=0)),
+    ("per-IP rate 1000/10s", dict(max_per_ip=0, max_per_subnet=0, ip_rate=1000, subnet_rate=0)),
+]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=17100)
+    parser.add_argument('--clients', type=int, default=3000)
+    parser.add_argument('--max-connections', type=int, default=2000)
+    parser.add_argument('--backlog', type=int, default=1024)
+    args = parser.parse_args()
+
+    print(f"Reconnect storm: {args.clients} clients at once, global cap {args.max_connections}, backlog {args.backlog}")
+    for i, (label, limits) in enumerate(SCENARIOS):
+        admission = AdmissionControl(max_connections=args.max_connections, **limits)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            results, elapsed = asyncio.run(storm(args.port + i, args.clients, args.backlog, admission))
+        print(f"{label:>28}: accepted {results['accepted']:5d} ({results['accepted'] / elapsed:7.0f}/s), "
+              f"rejected {results['rejected']:5d} ({results['rejected'] / elapsed:7.0f}/s), "
+              f"failed {results['failed']:4d}, {elapsed:.2f}s")
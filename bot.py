@@ -1,12 +1,14 @@
+import math
 import socket
 import argparse
 import random
-import time
 import threading
-from utils import NumericReplies
+from utils import NumericReplies, parse_message
+from commands import CommandRegistry
+from polls import PollManager, normalise_option, VOTE_OK, VOTE_ALREADY_VOTED, VOTE_INVALID_OPTION
 
 class Bot:
-    def __init__(self, host, port, name, channel):
+    def __init__(self, host, port, name, channel, poll_journal="polls.journal"):
         self.host = host if host else '::1'
         self.port = port if port else 6667
         self.name = name if name else "SuperBot"
@@ -14,10 +16,30 @@ class Bot:
         self.sock = None
         self.topic = None
         self.channel_members = [] 
-        self.active_poll = None
-        self.poll_votes = {}
-        self.poll_voters = set()  
+        self.max_poll_duration = 3600
+        self.polls = PollManager(self.post_to_channel, journal_path=poll_journal)
         self.is_muted = False
+        self.send_lock = threading.Lock()
+        self.commands = CommandRegistry(self.send_message)
+        self.register_commands()
+
+    def register_commands(self):
+        self.commands.register('hello', self.handle_hello)
+        self.commands.register('slap', self.handle_slap_command, cooldown=2)
+        self.commands.register('topic', self.handle_set_topic)
+        self.commands.register('poll', self.handle_create_poll, cooldown=5)
+        self.commands.register('vote', self.handle_vote)
+        self.commands.register('endpoll', self.handle_end_poll)
+        self.commands.register('polls', self.handle_list_polls, cooldown=2)
+        self.commands.register('kick', self.handle_kick_user)
+        self.commands.register('ban', self.handle_ban_user)
+        self.commands.register('unban', self.handle_unban_user)
+        self.commands.register('mute', self.handle_mute_user)
+        self.commands.register('unmute', self.handle_unmute_user)
+
+    def load_plugins(self, module_names):
+        for module_name in module_names:
+            self.commands.load_plugin(module_name, self)
 
     def connect(self):
         self.sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM) 
@@ -27,29 +49,38 @@ class Bot:
         self.send_message(f"NICK {self.name}")
         self.send_message(f"USER {self.name} 0 * :{self.name}")
         self.join_channel(self.channel)
+        self.polls.start()
         self.listen_for_messages()
 
     def send_message(self, message):
-        if self.is_muted:
-            self.sock.sendall((f"PRIVMSG {self.channel} :Bot is muted, unmute the bot to talk!\r\n").encode())
-            print(f"Attempted to send message while muted: {message}")
-            return
-        self.sock.sendall((message + "\r\n").encode())
+        with self.send_lock:
+            if self.is_muted:
+                self.sock.sendall((f"PRIVMSG {self.channel} :Bot is muted, unmute the bot to talk!\r\n").encode())
+                print(f"Attempted to send message while muted: {message}")
+                return
+            self.sock.sendall((message + "\r\n").encode())
         print(f'\nSent: {message}')
 
     def join_channel(self, channel):
         self.send_message(f"JOIN {channel}")
 
     def listen_for_messages(self):
+        buffer = b""
         try:
             while True:
-                response = self.sock.recv(2048).decode('utf-8', errors='replace')
-                if response:
-                    lines = response.strip()
-                    for line in lines.splitlines():
-                        if line:
-                            print(f"\nReceived: {line.strip()}") 
-                            self.handle_server_response(line.strip())
+                data = self.sock.recv(4096)
+                if not data:
+                    print("Server closed the connection.")
+                    self.disconnect()
+                    return
+                # A read can end part way through a line, keep the rest for the next one
+                buffer += data
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    line = line.decode('utf-8', errors='replace').strip()
+                    if line:
+                        print(f"\nReceived: {line}")
+                        self.handle_server_response(line)
 
         except ConnectionResetError as e:
             print(f"Connection lost: {e}")
@@ -60,74 +91,53 @@ class Bot:
 
     def disconnect(self):
         print("Disconnected from the server.")
+        self.polls.stop()
         try:
             self.sock.close()
         except Exception as e:
             print(f"Error while closing: {e}")
 
     def handle_server_response(self, response):
-        parts = response.split()
-        if len(parts) > 3 and parts[1] == NumericReplies.RPL_NAMREPLY.value: 
-            self.channel_members = []
-            names = parts[4:]  
-            for name in names:
-                if name.startswith(':'):
-                    name = name[1:]
-                if name and not name.startswith('#'): 
-                    self.channel_members.append(name)
-                    
+        source, command, params = parse_message(response)
+        if command == NumericReplies.RPL_NAMREPLY.value and len(params) > 3:
+            self.channel_members = [name for name in params[3].split() if not name.startswith('#')]
             print(f"\nUsers in {self.channel}: {self.channel_members}")
-        elif len(parts) > 3 and parts[1] == NumericReplies.RPL_TOPIC.value:
-            topic = ' '.join(parts[4:])[1:]
+        elif command == NumericReplies.RPL_TOPIC.value and len(params) > 2:
+            topic = params[2]
             self.send_message(f"PRIVMSG {self.channel} :Current topic for {self.channel}: {topic}")
             print({topic})
-        elif len(parts) > 3 and parts[1] == NumericReplies.RPL_NOTOPIC.value:
+        elif command == NumericReplies.RPL_NOTOPIC.value and len(params) > 2:
             self.send_message(f"PRIVMSG {self.channel} :No topic is set for {self.channel}")
-        elif len(parts) > 3 and parts[1] == 'PRIVMSG':
+        elif command == 'PRIVMSG' and len(params) > 1:
             # Handle private messages sent to the bot or commands prefixed with '!'
-            sender = parts[0].split('!')[0][1:]
-            message = ' '.join(parts[3:])[1:]
+            sender = source.split('!')[0] if source else ''
+            message = params[1]
             if message.startswith('!'):
-                command = message[1:]
-                self.handle_command(sender, command)
-            elif parts[2] == self.name:
-                private_message = ' '.join(parts[3:])[1:]
-                self.respond_to_private_message(sender, private_message)
-        elif len(parts) > 3 and parts[1] == 'MODE':
-            channel = parts[2]
-            mode = parts[3]
-            target = parts[4] if len(parts) > 4 else None
+                self.handle_command(sender, message[1:])
+            elif params[0] == self.name:
+                self.respond_to_private_message(sender, message)
+        elif command == 'MODE' and len(params) > 1:
+            channel = params[0]
+            mode = params[1]
+            target = params[2] if len(params) > 2 else None
             self.handle_mode_change(channel, mode, target)
-        if len(parts) <= 3 and parts[1] == 'JOIN':
+        elif command == 'JOIN' and len(params) <= 1:
             self.send_message(f"NAMES {self.channel}")
-        if len(parts) > 3 and parts[1] == 'TOPIC':
-            if parts[3] == ':No':
+        elif command == 'TOPIC' and len(params) > 1:
+            if params[1].split(' ', 1)[0] == 'No':
                 self.topic = "No topic is set."
             else:
-                self.topic = ' '.join(parts[3:])[1:]
+                self.topic = params[1]
 
     def handle_command(self, sender, command):
-        if command.startswith('hello'):
-            self.send_message(f"PRIVMSG {self.channel} :Hello, {sender}!")
-        elif command.startswith('slap'):
-            target = command.split()[1] if len(command.split()) > 1 else None
-            self.handle_slap_user(sender, target)
-        elif command.startswith('topic'):
-            self.handle_set_topic(sender, command)
-        elif command.startswith('poll'):
-            self.handle_create_poll(sender, command)
-        elif command.startswith('vote'):
-            self.handle_vote(sender, command)
-        elif command.startswith('kick'):
-            self.handle_kick_user(sender, command)
-        elif command.startswith('ban'):
-            self.handle_ban_user(sender, command)
-        elif command.startswith('unban'):
-            self.handle_unban_user(sender, command)
-        elif command.startswith('mute'):
-            self.handle_mute_user(sender, command)
-        elif command.startswith('unmute'):
-            self.handle_unmute_user(sender, command)
+        self.commands.dispatch(sender, command)
+
+    def handle_hello(self, sender, command):
+        self.send_message(f"PRIVMSG {self.channel} :Hello, {sender}!")
+
+    def handle_slap_command(self, sender, command):
+        target = command.split()[1] if len(command.split()) > 1 else None
+        self.handle_slap_user(sender, target)
 
     def handle_kick_user(self, sender, command):
         parts = command.split(' ', 1)
@@ -180,13 +190,16 @@ class Bot:
             self.is_muted = False
 
     def handle_create_poll(self, sender, command):
+        usage = "Invalid poll format. Usage: !poll [seconds] \"<question>\" <option1>;<option2>;<option3>...;"
         parts = command.split(' ', 1)
         if len(parts) < 2 or ';' not in parts[1]:
-            self.send_message(f"PRIVMSG {self.channel} :Invalid poll format. Usage: !poll \"<question>\" <option1>;<option2>;<option3>...;")
+            self.send_message(f"PRIVMSG {self.channel} :{usage}")
             return
         try:
             first_quote_index = parts[1].index('"')
             second_quote_index = parts[1].index('"', first_quote_index + 1)
+            duration_part = parts[1][:first_quote_index].strip()
+            duration = int(duration_part) if duration_part else None
             question = parts[1][first_quote_index + 1:second_quote_index].strip()
             options_part = parts[1][second_quote_index + 1:].strip()
             options = [opt.strip() for opt in options_part.split(';') if opt.strip()]
@@ -195,73 +208,80 @@ class Bot:
                 self.send_message(f"PRIVMSG {self.channel} :Error: A poll must have at least 2 options.")
                 return
 
-            if self.active_poll:
-                self.send_message(f"PRIVMSG {self.channel} :There is already an active poll. Wait for it to end.")
+            if duration is not None and not 0 < duration <= self.max_poll_duration:
+                self.send_message(f"PRIVMSG {self.channel} :Error: Poll duration must be between 1 and {self.max_poll_duration} seconds.")
                 return
 
-            self.active_poll = {
-                'question': question,
-                'options': options,
-                'start_time': time.time(),
-                'duration': 45
-            }
-            self.poll_votes = {}
-            self.poll_voters = set()  # Reset voters for new poll
+            poll = self.polls.create(self.channel, sender, question, options, duration)
 
-            poll_message = f"Poll started by {sender}\nQuestion:\"{question}\"\nOptions: {', '.join(options)}\nType !vote <option> to vote.\nTime limit: 45 seconds."
+            poll_message = f"Poll #{poll.id} started by {sender}\nQuestion:\"{question}\"\nOptions: {', '.join(options)}\nType !vote #{poll.id} <option> to vote.\nTime limit: {duration or self.polls.default_duration} seconds."
             for msg in poll_message.split('\n'):
                 self.send_message(f"PRIVMSG {self.channel} :{msg}")
-        
-            # Start a timer to end the poll
-            threading.Timer(45, self.handle_end_poll, args=[self.name]).start()
 
         except ValueError:
-            self.send_message(f"PRIVMSG {self.channel} :Invalid poll format. Usage: !poll \"<question>\" <option1>;<option2>;<option3>...;")
+            self.send_message(f"PRIVMSG {self.channel} :{usage}")
             return
 
-    def handle_end_poll(self, sender):
-        if not self.active_poll:
-            self.send_message(f"PRIVMSG {self.channel} :No active poll to end.")
+    def handle_end_poll(self, sender, command):
+        parts = command.split()
+        poll = self.find_poll(parts[1] if len(parts) > 1 else None)
+        if not poll:
+            self.send_message(f"PRIVMSG {self.channel} :No active poll to end. Usage: !endpoll #<id>")
             return
-
-        total_votes = sum(self.poll_votes.values())
-        results = []
-        for option in self.active_poll['options']:
-            votes = self.poll_votes.get(option, 0)
-            percentage = (votes / total_votes) * 100 if total_votes > 0 else 0
-            results.append(f"{option}: {votes} votes ({percentage:.2f}%)")
-
-        results_message = f"Poll ended for '{self.active_poll['question']}'\nResults:\n{', '.join(results)}"
-        for msg in results_message.split('\n'):
-            self.send_message(f"PRIVMSG {self.channel} :{msg}")
-        self.active_poll = None
-        self.poll_votes = {}
-        self.poll_voters = set()
-    
-    def handle_vote(self, sender, command):
-        if not self.active_poll:
-            self.send_message(f"PRIVMSG {self.channel} :No active poll.")
+        if sender != poll.creator:
+            self.send_message(f"PRIVMSG {self.channel} :{sender}, only {poll.creator} can end poll #{poll.id}.")
             return
+        self.polls.end(poll.id)
 
-        if sender in self.poll_voters:
-            self.send_message(f"PRIVMSG {self.channel} :{sender}, you have already voted in this poll.")
+    def handle_list_polls(self, sender, command):
+        active_polls = self.polls.get_active_polls(self.channel)
+        if not active_polls:
+            self.send_message(f"PRIVMSG {self.channel} :No active polls.")
             return
+        for poll in active_polls:
+            self.send_message(f"PRIVMSG {self.channel} :Poll #{poll.id} \"{poll.question}\" ({math.ceil(poll.time_left())}s left): {', '.join(poll.options)}")
 
-        parts = command.split(' ', 1)
+    # With a single active poll the id can be left out
+    def find_poll(self, poll_ref):
+        if poll_ref and poll_ref.startswith('#') and poll_ref[1:].isdigit():
+            poll = self.polls.polls.get(int(poll_ref[1:]))
+            return poll if poll and poll.channel == self.channel else None
+        active_polls = self.polls.get_active_polls(self.channel)
+        return active_polls[0] if len(active_polls) == 1 else None
+
+    def handle_vote(self, sender, command):
+        parts = command.split(' ', 2)
         if len(parts) < 2:
-            self.send_message(f"PRIVMSG {self.channel} :Invalid vote format. Usage: !vote <option>")
+            self.send_message(f"PRIVMSG {self.channel} :Invalid vote format. Usage: !vote [#<id>] <option>")
             return
 
-        vote = parts[1].strip().lower()
-        for option in self.active_poll['options']:
-            if vote == option.lower():
-                self.poll_votes[option] = self.poll_votes.get(option, 0) + 1
-                self.poll_voters.add(sender)
-                self.send_message(f"PRIVMSG {self.channel} :{sender}, your vote has been registered for {option}.")
-                return
+        if parts[1].startswith('#'):
+            poll = self.find_poll(parts[1])
+            vote = parts[2].strip() if len(parts) > 2 else ''
+        else:
+            poll = self.find_poll(None)
+            vote = ' '.join(parts[1:]).strip()
+
+        if not poll:
+            if self.polls.get_active_polls(self.channel):
+                self.send_message(f"PRIVMSG {self.channel} :{sender}, several polls are open. Usage: !vote #<id> <option>")
+            else:
+                self.send_message(f"PRIVMSG {self.channel} :No active poll.")
+            return
 
-        self.send_message(f"PRIVMSG {self.channel} :{sender}, invalid vote option. Valid options: {', '.join(self.active_poll['options'])}")
+        status, poll = self.polls.vote(poll.id, sender, vote)
+        if status == VOTE_OK:
+            option = poll.options[poll.keys[normalise_option(vote)]]
+            self.send_message(f"PRIVMSG {self.channel} :{sender}, your vote has been registered for {option}.")
+        elif status == VOTE_ALREADY_VOTED:
+            self.send_message(f"PRIVMSG {self.channel} :{sender}, you have already voted in poll #{poll.id}.")
+        elif status == VOTE_INVALID_OPTION:
+            self.send_message(f"PRIVMSG {self.channel} :{sender}, invalid vote option. Valid options: {', '.join(poll.options)}")
+        else:
+            self.send_message(f"PRIVMSG {self.channel} :No active poll.")
 
+    def post_to_channel(self, channel, message):
+        self.send_message(f"PRIVMSG {channel} :{message}")
 
     def handle_mode_change(self, channel, mode, target):
         if mode == '+b' and target:
@@ -311,9 +331,13 @@ class Bot:
 
     # jokes are from:
     # https://www.countryliving.com/life/entertainment/a36178514/hilariously-funny-jokes/
+    # Reading the jokes file is slow, so it runs off the receive loop
     def respond_to_private_message(self, sender, message):
+        self.commands.run_blocking(self.format_joke_reply, sender)
+
+    def format_joke_reply(self, sender):
         random_joke = self.get_joke_from_file()
-        self.send_message(f"PRIVMSG {sender} :{random_joke}")
+        return f"PRIVMSG {sender} :{random_joke}"
 
     def get_joke_from_file(self):
         try:
@@ -333,8 +357,11 @@ if __name__ == "__main__":
     parser.add_argument('--port', type=int)
     parser.add_argument('--name', type=str)
     parser.add_argument('--channel', type=str)
+    parser.add_argument('--plugin', action='append', default=[])
+    parser.add_argument('--poll-journal', type=str, default="polls.journal")
 
     args = parser.parse_args()
 
-    bot = Bot(args.host, args.port, args.name, args.channel)
+    bot = Bot(args.host, args.port, args.name, args.channel, args.poll_journal)
+    bot.load_plugins(args.plugin)
     bot.connect()
\ No newline at end of file
@@ -0,0 +1,70 @@
+import struct
+import time
+
+# Capture file layout: the magic line, then one record per event.
+# Each record is a little-endian header (seconds since the capture started,
+# connection id, event type, payload length) followed by the payload.
+# Connect records carry the peer host, line records the raw inbound line.
+CAPTURE_MAGIC = b"IRCCAP1\n"
+RECORD_HEADER = struct.Struct('<dIBH')
+MAX_PAYLOAD = 0xFFFF
+
+EVENT_CONNECT = 0
+EVENT_LINE = 1
+EVENT_DISCONNECT = 2
+
+class CaptureWriter:
+    def __init__(self, path, flush_interval=1.0, buffer_size=1 << 16):
+        self.path = path
+        self.file = open(path, 'wb', buffering=buffer_size)
+        self.file.write(CAPTURE_MAGIC)
+        self.start = time.monotonic()
+        self.flush_interval = flush_interval
+        self.last_flush = self.start
+        self.next_id = 1
+        self.records = 0
+
+    def write_record(self, conn_id, event, payload=b""):
+        # Connections still closing after the server stopped are not recorded
+        if self.file.closed:
+            return
+        now = time.monotonic()
+        payload = payload[:MAX_PAYLOAD]
+        self.file.write(RECORD_HEADER.pack(now - self.start, conn_id, event, len(payload)))
+        if payload:
+            self.file.write(payload)
+        self.records += 1
+        if now - self.last_flush >= self.flush_interval:
+            self.file.flush()
+            self.last_flush = now
+
+    def open_connection(self, host):
+        conn_id = self.next_id
+        self.next_id += 1
+        self.write_record(conn_id, EVENT_CONNECT, str(host).encode())
+        return conn_id
+
+    def record_line(self, conn_id, data):
+        self.write_record(conn_id, EVENT_LINE, data.rstrip(b"\r\n"))
+
+    def close_connection(self, conn_id):
+        self.write_record(conn_id, EVENT_DISCONNECT)
+
+    def close(self):
+        self.file.close()
+
+# Yields (timestamp, conn_id, event, payload) for every record in a capture
+def read_capture(path):
+    with open(path, 'rb') as file:
+        if file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        while True:
+            header = file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                # End of file, or a record cut short when the server stopped
+                return
+            timestamp, conn_id, event, length = RECORD_HEADER.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length:
+                return
+            yield timestamp, conn_id, event, payload
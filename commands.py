@@ -0,0 +1,115 @@
+import importlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# A single registered bot command
+class Command:
+    def __init__(self, name, handler, cooldown=0, blocking=False):
+        self.name = name
+        self.handler = handler
+        self.cooldown = cooldown
+        self.blocking = blocking
+
+# Maps the first token of a "!command" to its handler.
+# Handlers are called as handler(sender, command). Normal handlers run inline
+# on the receive loop and send their own replies. Blocking handlers run on a
+# bounded thread pool and return the line (or list of lines) to send, which
+# is posted back in the order the commands were received.
+class CommandRegistry:
+    def __init__(self, post, max_workers=4, sweep_interval=60):
+        self.post = post
+        self.commands = {}
+        self.last_used = {}
+        self.sweep_interval = sweep_interval
+        self.last_sweep = 0
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bot-cmd")
+        self.pending = deque()
+        self.pending_lock = threading.Lock()
+
+    def register(self, name, handler, cooldown=0, blocking=False):
+        self.commands[name.lower()] = Command(name.lower(), handler, cooldown, blocking)
+
+    def unregister(self, name):
+        self.commands.pop(name.lower(), None)
+
+    def command(self, name, cooldown=0, blocking=False):
+        def decorator(handler):
+            self.register(name, handler, cooldown, blocking)
+            return handler
+        return decorator
+
+    # A plugin is any importable module with a setup(bot) function that
+    # registers its commands through bot.commands
+    def load_plugin(self, module_name, bot):
+        module = importlib.import_module(module_name)
+        setup = getattr(module, 'setup', None)
+        if setup is None:
+            raise ValueError(f"Plugin {module_name} has no setup(bot) function")
+        setup(bot)
+        print(f"Loaded plugin {module_name}")
+        return module
+
+    def dispatch(self, sender, command):
+        token = command.split(' ', 1)[0].lower()
+        entry = self.commands.get(token)
+        if entry is None:
+            return False
+
+        if entry.cooldown:
+            now = time.monotonic()
+            self.sweep_cooldowns(now)
+            key = (token, sender)
+            last = self.last_used.get(key)
+            if last is not None and now - last < entry.cooldown:
+                print(f"Command {token} from {sender} ignored (cooldown)")
+                return True
+            self.last_used[key] = now
+
+        if entry.blocking:
+            self.run_blocking(entry.handler, sender, command)
+        else:
+            entry.handler(sender, command)
+        return True
+
+    # Forgets senders whose cooldown has run out, so the table only holds
+    # those still inside one
+    def sweep_cooldowns(self, now):
+        if now - self.last_sweep < self.sweep_interval:
+            return
+        self.last_sweep = now
+        expired = []
+        for key, last in self.last_used.items():
+            entry = self.commands.get(key[0])
+            if entry is None or now - last >= entry.cooldown:
+                expired.append(key)
+        for key in expired:
+            del self.last_used[key]
+
+    def run_blocking(self, func, *args):
+        with self.pending_lock:
+            future = self.executor.submit(func, *args)
+            self.pending.append(future)
+        future.add_done_callback(self._flush)
+
+    # Post results from the head of the queue only, so a slow handler holds
+    # back the replies of commands that arrived after it
+    def _flush(self, _future):
+        with self.pending_lock:
+            while self.pending and self.pending[0].done():
+                future = self.pending.popleft()
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error in blocking command: {e}")
+                    continue
+                if result is None:
+                    continue
+                if isinstance(result, str):
+                    result = [result]
+                for line in result:
+                    self.post(line)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,45 @@
+import json
+import socket
+import struct
+
+# Handover protocol over a Unix socket, from the running server to its
+# replacement:
+#   1. an 8 byte length followed by the JSON state
+#   2. the file descriptors, FDS_PER_MESSAGE at a time, each batch attached
+#      to a single marker byte so every recvmsg picks up exactly one batch
+#   3. the replacement answers ACK once it holds every descriptor
+FDS_PER_MESSAGE = 200
+LENGTH = struct.Struct('!Q')
+ACK = b"OK"
+
+def recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("handover connection closed early")
+        data += chunk
+    return bytes(data)
+
+def send_handover(sock, state, fds):
+    state['fd_count'] = len(fds)
+    payload = json.dumps(state, separators=(',', ':')).encode()
+    sock.sendall(LENGTH.pack(len(payload)) + payload)
+    for i in range(0, len(fds), FDS_PER_MESSAGE):
+        socket.send_fds(sock, [b"F"], fds[i:i + FDS_PER_MESSAGE])
+    if recv_exactly(sock, len(ACK)) != ACK:
+        raise ConnectionError("handover was not acknowledged")
+
+def receive_handover(sock):
+    length = LENGTH.unpack(recv_exactly(sock, LENGTH.size))[0]
+    state = json.loads(recv_exactly(sock, length))
+    fds = []
+    while len(fds) < state['fd_count']:
+        _, batch, flags, _ = socket.recv_fds(sock, 1, FDS_PER_MESSAGE)
+        if flags & socket.MSG_CTRUNC:
+            raise ConnectionError("file descriptors were truncated, raise the open file limit")
+        if not batch:
+            raise ConnectionError("handover connection closed early")
+        fds.extend(batch)
+    sock.sendall(ACK)
+    return state, fds
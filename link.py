@@ -0,0 +1,218 @@
+import asyncio
+
+from utils import parse_message
+
+# Server-to-server protocol
+#
+# Linked servers form a spanning tree. An event is sent once over each link
+# that needs it and never back over the link it arrived on, so no loop
+# detection is needed beyond refusing a server name that is already known.
+#
+#   SERVER <name> [password]        handshake, first line in each direction
+#   NODE <name>                     a server reachable through the sender
+#   SQUIT <name>                    that server has left the network
+#   UNICK <nick> <ts>               a user on the sender's side of the link,
+#                                   ts is when the user took the nickname
+#   KILL <nick> <ts> :<reason>      remove that user, who lost a nickname
+#                                   collision, sent towards its server
+#   SJOIN <channel> :<nick> ...     channel members, used during a burst
+#   ENDBURST                        the sender has sent all of its state
+#   ROUTE <nick> :<line>            a line for one user, forwarded hop by hop
+#   ERROR :<reason>                 the link is being closed
+#   :<source> NICK|JOIN|PART|PRIVMSG|TOPIC|MODE|KICK|QUIT ...
+#                                   client events, in the syntax clients use,
+#                                   NICK also carries the new ts
+#
+# An inbound link needs the link password, or must come from one of the
+# servers given with --link when there is none. Client events are dropped
+# unless their source is a user or server behind the link they arrived on.
+#
+# Nicknames, channel membership, topics and +b/+m are flooded to every server
+# because every node needs them to answer NAMES and to route. PRIVMSG to a
+# channel only goes over links that have members of that channel behind them.
+
+BURST_NICKS_PER_LINE = 50
+CLIENT_EVENTS = {"PRIVMSG", "NICK", "JOIN", "PART", "TOPIC", "MODE", "KICK", "QUIT"}
+
+# Class representing a connection to a neighbouring server
+class ServerLink:
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.name = None
+        self.bursting = True
+        self.closed = False
+
+    def send(self, line):
+        if not self.closed:
+            self.writer.write((line + "\r\n").encode())
+
+    def route(self, nickname, line):
+        self.send(f"ROUTE {nickname} :{line}")
+
+    def close(self, reason=None):
+        if self.closed:
+            return
+        if reason:
+            self.send(f"ERROR :{reason}")
+        self.closed = True
+        self.writer.close()
+
+    async def run(self, first_line=None, outgoing=False):
+        server = self.server
+        if outgoing:
+            self.send(self.format_server_line())
+
+        try:
+            if first_line is None:
+                first_line = (await self.reader.readline()).decode().strip()
+            if not self.handshake(first_line):
+                return
+            if not outgoing:
+                self.send(self.format_server_line())
+
+            server.add_link(self)
+            self.send_burst()
+            await self.writer.drain()
+
+            while not self.closed:
+                data = await self.reader.readline()
+                if not data:
+                    break
+                line = data.decode().strip()
+                if line:
+                    self.process_line(line)
+                    if self.writer.transport.get_write_buffer_size() > 65536:
+                        await self.writer.drain()
+
+        except (ConnectionResetError, BrokenPipeError) as e:
+            print(f"Link to {self.name} lost: {e}")
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if self.name and self in server.links and not server.handed_over:
+                server.remove_link(self)
+            self.close()
+
+    def format_server_line(self):
+        if self.server.link_password:
+            return f"SERVER {self.server.name} {self.server.link_password}"
+        return f"SERVER {self.server.name}"
+
+    def handshake(self, line):
+        source, command, params = parse_message(line)
+        if command != "SERVER" or not params:
+            self.close("Expected SERVER")
+            return False
+
+        name = params[0]
+        password = params[1] if len(params) > 1 else None
+        if self.server.link_password and password != self.server.link_password:
+            print(f"Link from {name} refused: bad password")
+            self.close("Bad link password")
+            return False
+        if name == self.server.name or name in self.server.servers:
+            print(f"Link from {name} refused: already on the network")
+            self.close(f"Server {name} already exists")
+            return False
+
+        self.name = name
+        print(f"Linked to server {name}")
+        return True
+
+    def send_burst(self):
+        server = self.server
+        for name, link in server.servers.items():
+            if link is not self:
+                self.send(f"NODE {name}")
+
+        for nickname, client in server.users.items():
+            if client.link is not self:
+                self.send(f"UNICK {nickname} {client.nick_ts}")
+
+        for channel in server.channels.values():
+            nicknames = [member.nickname for member in channel.members if member.link is not self]
+            for i in range(0, len(nicknames), BURST_NICKS_PER_LINE):
+                self.send(f"SJOIN {channel.name} :{' '.join(nicknames[i:i + BURST_NICKS_PER_LINE])}")
+            if channel.topic:
+                self.send(f":{server.name} TOPIC {channel.name} :{channel.topic}")
+            for target in channel.banned_users:
+                self.send(f":{server.name} MODE {channel.name} +b {target}")
+            for target in channel.muted_users:
+                self.send(f":{server.name} MODE {channel.name} +m {target}")
+
+        self.send("ENDBURST")
+
+    # A client event may only come from a user or server behind this link
+    def owns_source(self, source):
+        if source is None:
+            return False
+        return self.server.get_remote_user(self, source) is not None or self.server.servers.get(source) is self
+
+    def process_line(self, line):
+        server = self.server
+        source, command, params = parse_message(line)
+
+        if command in CLIENT_EVENTS and not self.owns_source(source):
+            print(f"Dropped {command} from {self.name}: {source} is not behind that link")
+            return
+
+        if command == "NODE":
+            name = params[0]
+            if name == server.name or name in server.servers:
+                print(f"Server {name} reachable twice, closing link to {self.name}")
+                self.close(f"Server {name} already exists")
+                return
+            server.servers[name] = self
+            server.propagate(line, exclude=self)
+        elif command == "SQUIT":
+            if server.servers.get(params[0]) is self:
+                del server.servers[params[0]]
+                server.propagate(line, exclude=self)
+        elif command == "UNICK":
+            if server.introduce_remote_user(params[0], self, float(params[1])):
+                server.propagate(line, exclude=self)
+        elif command == "SJOIN":
+            for nickname in params[1].split():
+                server.remote_join(self, nickname, params[0])
+            server.propagate(line, exclude=self)
+        elif command == "ENDBURST":
+            self.bursting = False
+            print(f"Burst from {self.name} complete")
+        elif command == "KILL":
+            server.remote_kill(self, params[0], float(params[1]), params[2] if len(params) > 2 else "Killed")
+        elif command == "ROUTE":
+            server.route_to_user(params[0], params[1])
+        elif command == "ERROR":
+            print(f"Link to {self.name} closed by peer: {params[0] if params else ''}")
+            self.close()
+        elif command == "PRIVMSG":
+            target, msg = params[0], params[1]
+            if target.startswith("#"):
+                server.remote_channel_message(self, source, target, msg)
+            else:
+                server.route_to_user(target, f":{source} PRIVMSG {target} :{msg}")
+        elif command == "NICK":
+            if server.remote_nick(self, source, params[0], float(params[1])):
+                server.propagate(line, exclude=self)
+        elif command == "JOIN":
+            server.remote_join(self, source, params[0])
+            server.propagate(line, exclude=self)
+        elif command == "PART":
+            server.remote_part(self, source, params[0])
+            server.propagate(line, exclude=self)
+        elif command == "TOPIC":
+            server.remote_topic(source, params[0], params[1])
+            server.propagate(line, exclude=self)
+        elif command == "MODE":
+            server.remote_mode(source, params[0], params[1], params[2])
+            server.propagate(line, exclude=self)
+        elif command == "KICK":
+            server.remote_kick(source, params[0], params[1])
+            server.propagate(line, exclude=self)
+        elif command == "QUIT":
+            server.remote_quit(self, source, params[0] if params else "Quit")
+            server.propagate(line, exclude=self)
+        else:
+            print(f"Unknown command from server {self.name}: {line}")
@@ -0,0 +1,200 @@
+import json
+import math
+import os
+import threading
+import time
+
+VOTE_OK = "ok"
+VOTE_NO_POLL = "no_poll"
+VOTE_ALREADY_VOTED = "already_voted"
+VOTE_INVALID_OPTION = "invalid_option"
+
+def normalise_option(option):
+    return ' '.join(option.split()).casefold()
+
+# Class representing a single poll and its running tally
+class Poll:
+    def __init__(self, poll_id, channel, question, options, creator, ends_at):
+        self.id = poll_id
+        self.channel = channel
+        self.question = question
+        self.options = options
+        self.creator = creator
+        self.ends_at = ends_at
+        self.keys = {normalise_option(option): index for index, option in enumerate(options)}
+        self.tallies = [0] * len(options)
+        self.voters = set()
+        self.changed = False
+        self.timer = None
+
+    def total_votes(self):
+        return sum(self.tallies)
+
+    def time_left(self):
+        return max(0, self.ends_at - time.time())
+
+    def format_results(self):
+        total_votes = self.total_votes()
+        results = []
+        for option, votes in zip(self.options, self.tallies):
+            percentage = (votes / total_votes) * 100 if total_votes > 0 else 0
+            results.append(f"{option}: {votes} votes ({percentage:.2f}%)")
+        return ', '.join(results)
+
+# Runs any number of polls per channel. Every state change is appended to a
+# journal (one JSON object per line) so polls can be rebuilt after a restart.
+class PollManager:
+    def __init__(self, post, journal_path="polls.journal", default_duration=45, report_interval=15):
+        self.post = post
+        self.journal_path = journal_path
+        self.default_duration = default_duration
+        self.report_interval = report_interval
+        self.polls = {}
+        self.next_id = 1
+        self.lock = threading.RLock()
+        self.journal = None
+        self.reporter = None
+        self.running = False
+
+    def start(self):
+        with self.lock:
+            self.restore()
+            if self.journal_path:
+                self.journal = open(self.journal_path, 'a')
+            self.running = True
+            for poll in list(self.polls.values()):
+                self.schedule_end(poll)
+        if self.report_interval:
+            self.reporter = threading.Thread(target=self.report_loop, name="poll-reporter", daemon=True)
+            self.reporter.start()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            for poll in self.polls.values():
+                if poll.timer:
+                    poll.timer.cancel()
+            if self.journal:
+                self.journal.close()
+                self.journal = None
+
+    def create(self, channel, creator, question, options, duration=None):
+        duration = duration if duration else self.default_duration
+        with self.lock:
+            poll = Poll(self.next_id, channel, question, options, creator, time.time() + duration)
+            self.next_id += 1
+            self.polls[poll.id] = poll
+            self.write_journal({'op': 'create', 'id': poll.id, 'channel': channel, 'question': question,
+                                'options': options, 'creator': creator, 'ends_at': poll.ends_at})
+            self.schedule_end(poll)
+            return poll
+
+    def vote(self, poll_id, voter, option):
+        with self.lock:
+            poll = self.polls.get(poll_id)
+            if poll is None:
+                return VOTE_NO_POLL, None
+            if voter in poll.voters:
+                return VOTE_ALREADY_VOTED, poll
+            index = poll.keys.get(normalise_option(option))
+            if index is None:
+                return VOTE_INVALID_OPTION, poll
+            poll.tallies[index] += 1
+            poll.voters.add(voter)
+            poll.changed = True
+            self.write_journal({'op': 'vote', 'id': poll_id, 'voter': voter, 'option': index})
+            return VOTE_OK, poll
+
+    def end(self, poll_id):
+        with self.lock:
+            poll = self.polls.pop(poll_id, None)
+            if poll is None:
+                return None
+            if poll.timer:
+                poll.timer.cancel()
+            self.write_journal({'op': 'end', 'id': poll_id})
+
+        self.post(poll.channel, f"Poll #{poll.id} ended for '{poll.question}'")
+        self.post(poll.channel, "Results:")
+        self.post(poll.channel, poll.format_results())
+        return poll
+
+    def get_active_polls(self, channel):
+        with self.lock:
+            return [poll for poll in self.polls.values() if poll.channel == channel]
+
+    def schedule_end(self, poll):
+        if not self.running:
+            return
+        poll.timer = threading.Timer(poll.time_left(), self.end, args=[poll.id])
+        poll.timer.daemon = True
+        poll.timer.start()
+
+    # Interim results are only posted for polls that got votes since the last report
+    def report_loop(self):
+        while self.running:
+            time.sleep(self.report_interval)
+            with self.lock:
+                changed = [poll for poll in self.polls.values() if poll.changed]
+                for poll in changed:
+                    poll.changed = False
+            for poll in changed:
+                self.post(poll.channel, f"Poll #{poll.id} ({math.ceil(poll.time_left())}s left): {poll.format_results()}")
+
+    def write_journal(self, record):
+        if self.journal:
+            self.journal.write(json.dumps(record, separators=(',', ':')) + "\n")
+            self.journal.flush()
+
+    # Replays the journal, then rewrites it with only the polls still open so
+    # it does not grow without bound across restarts
+    def restore(self):
+        if not self.journal_path or not os.path.exists(self.journal_path):
+            return
+
+        polls = {}
+        next_id = self.next_id
+        with open(self.journal_path, 'r') as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write
+                    continue
+                op = record.get('op')
+                if op == 'create':
+                    poll = Poll(record['id'], record['channel'], record['question'], record['options'],
+                                record['creator'], record['ends_at'])
+                    polls[poll.id] = poll
+                    next_id = max(next_id, poll.id + 1)
+                elif op == 'vote' and record['id'] in polls:
+                    poll = polls[record['id']]
+                    if record['voter'] not in poll.voters:
+                        poll.tallies[record['option']] += 1
+                        poll.voters.add(record['voter'])
+                elif op == 'tally' and record['id'] in polls:
+                    poll = polls[record['id']]
+                    poll.tallies = record['tallies']
+                    poll.voters = set(record['voters'])
+                elif op == 'end':
+                    polls.pop(record['id'], None)
+                elif op == 'next_id':
+                    next_id = max(next_id, record['id'])
+
+        self.polls = polls
+        self.next_id = next_id
+        print(f"Restored {len(polls)} active polls from {self.journal_path}")
+
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, 'w') as journal:
+            journal.write(json.dumps({'op': 'next_id', 'id': next_id}, separators=(',', ':')) + "\n")
+            for poll in polls.values():
+                journal.write(json.dumps({'op': 'create', 'id': poll.id, 'channel': poll.channel,
+                                          'question': poll.question, 'options': poll.options,
+                                          'creator': poll.creator, 'ends_at': poll.ends_at},
+                                         separators=(',', ':')) + "\n")
+                # Individual choices are not kept in memory, so compacted
+                # votes are written as per-option tallies
+                journal.write(json.dumps({'op': 'tally', 'id': poll.id, 'tallies': poll.tallies,
+                                          'voters': sorted(poll.voters)}, separators=(',', ':')) + "\n")
+        os.replace(tmp_path, self.journal_path)
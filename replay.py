@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+
+from admission import AdmissionControl
+from capture import read_capture, EVENT_CONNECT, EVENT_LINE, EVENT_DISCONNECT
+from server import Server
+from utils import Client
+
+# Takes the place of a client connection and counts what the server sends
+class ReplayWriter:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def write(self, data):
+        self.stats['bytes_out'] += len(data)
+        self.stats['lines_out'] += 1
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+# Feeds the captured lines straight into process_message, so the measured
+# time is the server's own work without any socket I/O
+async def replay(path, speed, profiler):
+    server = Server(admission=AdmissionControl(0, 0, 0, 0, 0))
+    stats = {'connections': 0, 'lines_in': 0, 'lines_out': 0, 'bytes_out': 0, 'errors': 0}
+    clients = {}
+    latencies = []
+    start = time.perf_counter()
+
+    for timestamp, conn_id, event, payload in read_capture(path):
+        if speed:
+            delay = timestamp / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        if event == EVENT_CONNECT:
+            client = Client(ReplayWriter(stats))
+            clients[conn_id] = client
+            server.clients[(payload.decode(), conn_id)] = client
+            stats['connections'] += 1
+        elif event == EVENT_LINE:
+            client = clients.get(conn_id)
+            message = payload.decode().strip()
+            if client is None or not message:
+                continue
+            stats['lines_in'] += 1
+            if profiler:
+                profiler.enable()
+            line_start = time.perf_counter()
+            try:
+                server.process_message(message, client)
+            except Exception as e:
+                # The live server drops the connection, so do the same and
+                # ignore the rest of its lines
+                print(f"Error on connection {conn_id}: {e!r}, disconnecting it")
+                stats['errors'] += 1
+                del clients[conn_id]
+                server.disconnect_client(client)
+            finally:
+                latencies.append(time.perf_counter() - line_start)
+                if profiler:
+                    profiler.disable()
+        elif event == EVENT_DISCONNECT:
+            client = clients.pop(conn_id, None)
+            if client is not None:
+                server.disconnect_client(client)
+
+        # Let the drain tasks queued by Client.send run
+        if stats['lines_in'] % 256 == 0:
+            await asyncio.sleep(0)
+
+    stats['elapsed'] = time.perf_counter() - start
+    return stats, latencies
+
+def build_report(path, speed, stats, latencies):
+    latencies = sorted(latencies)
+    busy = sum(latencies)
+    return {
+        'capture': path,
+        'speed': speed if speed else 'max',
+        'connections': stats['connections'],
+        'lines_in': stats['lines_in'],
+        'lines_out': stats['lines_out'],
+        'errors': stats['errors'],
+        'bytes_out': stats['bytes_out'],
+        'elapsed_s': round(stats['elapsed'], 4),
+        'lines_per_s': round(stats['lines_in'] / busy) if busy else 0,
+        'latency_us': {
+            'p50': round(percentile(latencies, 0.50) * 1e6, 1),
+            'p90': round(percentile(latencies, 0.90) * 1e6, 1),
+            'p99': round(percentile(latencies, 0.99) * 1e6, 1),
+            'max': round(latencies[-1] * 1e6, 1) if latencies else 0,
+        },
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a capture recorded with server.py --capture")
+    parser.add_argument('capture', type=str)
+    parser.add_argument('--speed', type=float, default=0,
+                        help="1 replays at recorded speed, 2 at double speed, 0 (default) as fast as possible")
+    parser.add_argument('--profile', action='store_true', help="run process_message under cProfile")
+    parser.add_argument('--profile-output', type=str, help="save raw cProfile stats to this file")
+    parser.add_argument('--top', type=int, default=25)
+    parser.add_argument('--json', type=str, help="also write the report to this file")
+    parser.add_argument('--verbose', action='store_true', help="keep the server's own logging")
+    args = parser.parse_args()
+
+    profiler = cProfile.Profile() if args.profile else None
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull):
+            stats, latencies = asyncio.run(replay(args.capture, args.speed, profiler))
+
+    report = build_report(args.capture, args.speed, stats, latencies)
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if profiler:
+        if args.profile_output:
+            profiler.dump_stats(args.profile_output)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(args.top)
+        print(output.getvalue())
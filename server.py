@@ -1,48 +1,115 @@
+import argparse
 import asyncio
+import base64
+import ipaddress
+import os
 import socket
 import random
+import time
 from datetime import datetime, timedelta
 
 from utils import *
-from utils import Channel, Client
+from utils import ChannelRegistry, Client, RemoteClient
+from link import ServerLink
+from admission import AdmissionControl
+from capture import CaptureWriter
+from handover import send_handover, receive_handover
 
 class Server:
-    def __init__(self, host='::1', port=6667):
+    def __init__(self, host='::1', port=6667, name=None, link_password=None, links=None,
+                 admission=None, listen_backlog=128, registration_timeout=30, capture_path=None,
+                 handover_path=None, takeover_path=None, registered_channels=None):
         self.host = host
         self.port = port
+        self.name = name if name else f"irc-{port}"
+        self.link_password = link_password
+        self.link_addresses = links if links else []
+        self.links = []
+        self.servers = {}
+        self.users = {}
         self.clients = {}
-        self.channels = {}
+        self.channels = ChannelRegistry(registered_channels)
         self.nicknames = set()
         self.check_interval = 10
         self.bot_nickname = "SuperBot"
         self.banned_users = {}
         self.muted_users = {}
+        self.admission = admission if admission else AdmissionControl()
+        self.listen_backlog = listen_backlog
+        self.registration_timeout = registration_timeout
+        self.capture = CaptureWriter(capture_path) if capture_path else None
+        self.handover_path = handover_path
+        self.takeover_path = takeover_path
+        self.handed_over = False
+        self.server = None
+        # The asyncio server currently accepting, a replacement for self.server
+        # after a failed handover
+        self.accepting_server = None
 
     async def handle_client(self, reader, writer):
         addr = writer.get_extra_info('peername')
+        reason = self.admission.admit(addr[0])
+        if reason:
+            print(f"Refused connection from {addr}: {reason}")
+            writer.write(f"ERROR :Closing link: {reason}\r\n".encode())
+            writer.close()
+            return
+
         client = Client(writer)
-        client.last_active = datetime.now()
         self.clients[addr] = client
+        await self.serve_client(reader, client, addr)
+
+    async def serve_client(self, reader, client, addr):
+        writer = client.writer
+        client.reader = reader
+        client.last_active = datetime.now()
+        registration_deadline = client.last_active + timedelta(seconds=self.registration_timeout)
+        capture_id = self.capture.open_connection(addr[0]) if self.capture else None
 
         try:
             while True:
-                data = await reader.readline()
+                if client.username is None:
+                    remaining = (registration_deadline - datetime.now()).total_seconds()
+                    data = await asyncio.wait_for(reader.readline(), max(remaining, 0))
+                else:
+                    data = await reader.readline()
                 if not data:
                     break
+                if capture_id:
+                    self.capture.record_line(capture_id, data)
                 message = data.decode().strip()
 
+                if message.startswith("SERVER ") and not client.nickname:
+                    if not self.link_password and not self.is_link_peer(addr[0]):
+                        print(f"Refused server link from {addr}: no link password set and not a --link peer")
+                        client.send("ERROR :Closing link: Server links need a password")
+                        break
+                    del self.clients[addr]
+                    client = None
+                    await ServerLink(self, reader, writer).run(message)
+                    return
+
                 if message:
                     client.last_active = datetime.now()
                     print(client.last_active)
                     print(f"\nReceived from <{client.nickname}>: {message}")
                     self.process_message(message, client)
 
+        except asyncio.TimeoutError:
+            print(f"Client {addr} did not register in time. Disconnecting.")
+            client.send("ERROR :Closing link: Registration timed out")
         except ConnectionResetError:
             print(f"Connection reset by {addr}. Disconnecting client.")
         except asyncio.CancelledError:
             pass
         finally:
-            self.disconnect_client(client)
+            # After a handover the new process owns the connection
+            if not self.handed_over:
+                self.admission.release(addr[0])
+                if client:
+                    self.disconnect_client(client)
+                if capture_id:
+                    self.capture.close_connection(capture_id)
 
     async def check_inactive_clients(self):
         while True:
@@ -97,18 +164,20 @@ class Server:
             self.set_mode(client, parts[1:])
 
     def set_topic(self, client, channel_name, topic):
-        if channel_name in self.channels:
-            channel = self.channels[channel_name]
+        channel = self.channels.get(channel_name)
+        if channel:
             channel.topic = topic
-            topic_msg = f":{client.nickname} TOPIC {channel_name} :{topic}"
+            topic_msg = f":{client.nickname} TOPIC {channel.name} :{topic}"
             channel.broadcast(topic_msg)
+            self.propagate(topic_msg)
             # client.send(f":{self.host} TOPIC {channel_name} :{topic}")
         else:
             client.send(format_not_on_channel_message(self.host, client.nickname, channel_name))
 
     def get_topic(self, client, channel_name):
-        if channel_name in self.channels:
-            topic = self.channels[channel_name].topic
+        channel = self.channels.get(channel_name)
+        if channel:
+            topic = channel.topic
             if topic:
                 client.send(f":{self.host} {NumericReplies.RPL_TOPIC.value} {client.nickname} {channel_name} :{topic}")
             else:
@@ -134,9 +203,17 @@ class Server:
         if current_nickname in self.nicknames and current_nickname != nickname:
             print(f"DEBUG: Removing old nickname '{current_nickname}' from list.")
             self.nicknames.remove(current_nickname)
+            self.users.pop(current_nickname, None)
 
         self.nicknames.add(nickname)
+        self.users[nickname] = client
         client.nickname = nickname
+        client.nick_ts = time.time()
+
+        if current_nickname:
+            self.propagate(f":{current_nickname} NICK {nickname} {client.nick_ts}")
+        else:
+            self.propagate(f"UNICK {nickname} {client.nick_ts}")
 
         print(f"DEBUG: Nickname changed to '{nickname}'")
 
@@ -166,31 +243,30 @@ class Server:
             client.send(error_msg)
             return
 
-        if channel_name not in self.channels:
-            self.channels[channel_name] = Channel(channel_name)
-
-        channel = self.channels[channel_name]
+        channel = self.channels.get_or_create(channel_name)
         if channel.is_banned(client.nickname):
             client.send(format_banned_from_channel_message(self.host, client.nickname, channel_name))
+            self.channels.release(channel)
             return
 
         channel.join(client)
-        join_msg = f":{client.nickname} JOIN {channel_name}"
+        join_msg = f":{client.nickname} JOIN {channel.name}"
         channel.broadcast(join_msg)
-        self.send_names_list(client, channel_name)
+        self.propagate(join_msg)
+        self.send_names_list(client, channel.name)
 
     def part_channel(self, client, channel_name):
-        if channel_name in self.channels:
-            channel = self.channels[channel_name]
-
+        channel = self.channels.get(channel_name)
+        if channel:
             if client in channel.members:
-                part_msg = f":{client.nickname} PART {channel_name}"
+                part_msg = f":{client.nickname} PART {channel.name}"
                 channel.broadcast(part_msg, exclude=client)
 
                 channel.part(client)
-                client.send(part_msg)
-                if channel.is_empty():
-                    del self.channels[channel_name]
+                if client.link is None:
+                    client.send(part_msg)
+                self.propagate(part_msg)
+                self.channels.release(channel)
             else:
                 client.send(format_not_on_channel_message(self.host, client.nickname, channel_name))
         else:
@@ -198,8 +274,8 @@ class Server:
 
     def send_message(self, client, recipient, msg):
         if recipient.startswith("#"):
-            if recipient in self.channels:
-                channel = self.channels[recipient]
+            channel = self.channels.get(recipient)
+            if channel:
                 if channel.is_muted(client.nickname) or channel.is_banned(client.nickname):
                     client.send(f":{self.host} 404 {client.nickname} {recipient} :Cannot send to channel (You're muted)")
                 elif client in channel.members:
@@ -208,16 +284,13 @@ class Server:
                     elif client.nickname in channel.muted_users:
                         client.send(f":{self.host} 404 {client.nickname} {recipient} :Cannot send to channel (You're muted)")
                     else:
-                        priv_msg = f":{client.nickname} PRIVMSG {recipient} :{msg}"
+                        priv_msg = f":{client.nickname} PRIVMSG {channel.name} :{msg}"
                         channel.broadcast(priv_msg, exclude=client)
+                        self.propagate_to_channel(channel, priv_msg)
             else:
                 client.send(format_not_on_channel_message(self.host, client.nickname, recipient))
         else:
-            target_client = None
-            for irc_client in self.clients.values():
-                if irc_client.nickname == recipient:
-                    target_client = irc_client
-                    break
+            target_client = self.users.get(recipient)
 
             if target_client:
                 priv_msg = f":{client.nickname} PRIVMSG {recipient} :{msg}"
@@ -234,11 +307,11 @@ class Server:
         mode = parts[1]
         target = parts[2] if len(parts) > 2 else None
 
-        if channel_name not in self.channels:
+        channel = self.channels.get(channel_name)
+        if channel is None:
             client.send(format_not_on_channel_message(self.host, client.nickname, channel_name))
             return
 
-        channel = self.channels[channel_name]
         if mode == "+b" and target:
             self.ban_user(client, channel, target)
         elif mode == "-b" and target:
@@ -250,8 +323,8 @@ class Server:
 
     def kick_user(self, client, channel_name, target_nickname):
         print(f"Attempting to kick {target_nickname} from {channel_name} by {client.nickname}")
-        if channel_name in self.channels:
-            channel = self.channels[channel_name]
+        channel = self.channels.get(channel_name)
+        if channel:
             target_client = None
             for member in channel.members:
                 if member.nickname == target_nickname:
@@ -265,9 +338,13 @@ class Server:
                     client.send(f":{self.host} {NumericReplies.ERR_NOPRIVILEGES.value} {client.nickname} {channel_name} :You cannot kick yourself\n")
                     return
 
-                kick_msg = f":{client.nickname} KICK {channel_name} {target_nickname} :Kicked by {client.nickname}"
+                kick_msg = f":{client.nickname} KICK {channel.name} {target_nickname} :Kicked by {client.nickname}"
                 channel.broadcast(kick_msg)
                 channel.part(target_client)
+                self.propagate(kick_msg)
+                self.channels.release(channel)
+                if target_client.link is not None:
+                    return
                 target_client.send(kick_msg)
 
                 if target_client.nickname == self.bot_nickname:
@@ -284,14 +361,16 @@ class Server:
         if not channel.is_banned(target):
             channel.ban_user(target)
             channel.broadcast(format_mode_message(self.host, client.nickname, channel.name, "+b", target))
+            self.propagate(f":{client.nickname} MODE {channel.name} +b {target}")
 
+            # A user on another server is parted there, when the MODE reaches it
             target_client = None
             for member in channel.members:
                 if member.nickname == target:
                     target_client = member
                     break
 
-            if target_client:
+            if target_client and target_client.link is None:
                 self.part_channel(target_client, channel.name)
 
 
@@ -299,20 +378,26 @@ class Server:
         if channel.is_banned(target):
             channel.unban_user(target)
             channel.broadcast(format_mode_message(self.host, client.nickname, channel.name, "-b", target))
+            self.propagate(f":{client.nickname} MODE {channel.name} -b {target}")
 
     def mute_user(self, client, channel, target):
         if not channel.is_muted(target):
             channel.mute_user(target)
             channel.broadcast(format_mode_message(self.host, client.nickname, channel.name, "+m", target))
+            self.propagate(f":{client.nickname} MODE {channel.name} +m {target}")
     
     def unmute_user(self, client, channel, target):
         if channel.is_muted(target):
             channel.unmute_user(target)
             channel.broadcast(format_mode_message(self.host, client.nickname, channel.name, "-m", target))
+            self.propagate(f":{client.nickname} MODE {channel.name} -m {target}")
     
     def disconnect_client(self, client):
-        if client.nickname in self.nicknames:
+        # A killed client has already given up its nickname
+        if self.users.get(client.nickname) is client:
             self.nicknames.remove(client.nickname)
+            self.users.pop(client.nickname, None)
+            self.propagate(f":{client.nickname} QUIT :Disconnected")
 
         channels_to_update = list(self.channels.values())
         for channel in channels_to_update:
@@ -320,9 +405,7 @@ class Server:
                 part_msg = f":{client.nickname} PART {channel.name} :Disconnected"
                 channel.broadcast(part_msg, exclude=client)
                 channel.part(client)
-
-                if channel.is_empty():
-                    del self.channels[channel.name]
+                self.channels.release(channel)
 
         if client.writer:
             try:
@@ -350,21 +433,440 @@ class Server:
             print(f"Unexpected error during close: {e}")
 
     def send_names_list(self, client, channel_name):
-        if channel_name in self.channels:
-            channel = self.channels[channel_name]
+        channel = self.channels.get(channel_name)
+        if channel:
             names_list = " ".join([member.nickname for member in channel.members])
-            client.send(f":{self.host} {NumericReplies.RPL_NAMREPLY.value} {client.nickname} = {channel_name} :{names_list}\n")
-            client.send(f":{self.host} {NumericReplies.RPL_ENDOFNAMES.value} {client.nickname} {channel_name} :End of NAMES list\n") 
+            client.send(f":{self.host} {NumericReplies.RPL_NAMREPLY.value} {client.nickname} = {channel.name} :{names_list}\n")
+            client.send(f":{self.host} {NumericReplies.RPL_ENDOFNAMES.value} {client.nickname} {channel.name} :End of NAMES list\n") 
         else:
             client.send(format_not_on_channel_message(self.host, client.nickname, channel_name))
 
+    # Server links
+
+    def add_link(self, link):
+        self.links.append(link)
+        self.servers[link.name] = link
+        self.propagate(f"NODE {link.name}", exclude=link)
+
+    def remove_link(self, link):
+        print(f"Link to {link.name} closed, removing its users")
+        self.links.remove(link)
+        for name, server_link in list(self.servers.items()):
+            if server_link is link:
+                del self.servers[name]
+                self.propagate(f"SQUIT {name}")
+
+        for nickname, user in list(self.users.items()):
+            if user.link is link:
+                self.remote_quit(link, nickname, f"{self.name} {link.name}")
+                self.propagate(f":{nickname} QUIT :{self.name} {link.name}")
+
+    def propagate(self, line, exclude=None):
+        for link in self.links:
+            if link is not exclude:
+                link.send(line)
+
+    def propagate_to_channel(self, channel, line, exclude=None):
+        for link in channel.remote_links():
+            if link is not exclude:
+                link.send(line)
+
+    def route_to_user(self, nickname, line):
+        target_client = self.users.get(nickname)
+        if target_client:
+            target_client.send(line)
+
+    # Without a password only the servers we were told to link to may link in
+    def is_link_peer(self, host):
+        address = normalise_address(host)
+        return any(normalise_address(link_host) == address for link_host, _ in self.link_addresses)
+
+    def get_remote_user(self, link, nickname):
+        user = self.users.get(nickname)
+        if user is None or user.link is not link:
+            return None
+        return user
+
+    # Both ends of a link see the same collision and settle it the same way:
+    # whoever took the nickname first keeps it and the other user is killed
+    # on every server, on a tie both are. Returns whether the user arriving
+    # over the link may have the nickname.
+    def resolve_nick_collision(self, link, nickname, nick_ts):
+        existing = self.users.get(nickname)
+        if existing is None:
+            return True
+        print(f"Nickname collision on {nickname} from {link.name}")
+        if nick_ts <= existing.nick_ts:
+            self.kill_user(existing, "Nickname collision")
+        if existing.nick_ts <= nick_ts:
+            link.send(f"KILL {nickname} {nick_ts} :Nickname collision")
+            return False
+        return True
+
+    def kill_user(self, user, reason):
+        if user.link is None:
+            user.send(f"ERROR :Closing link: Killed ({reason})")
+            self.disconnect_client(user)
+        else:
+            user.link.send(f"KILL {user.nickname} {user.nick_ts} :{reason}")
+            self.forget_remote_user(user, reason)
+            self.propagate(f":{user.nickname} QUIT :{reason}", exclude=user.link)
+
+    def remote_kill(self, link, nickname, nick_ts, reason):
+        user = self.users.get(nickname)
+        if user is None or user.nick_ts != nick_ts or user.link is link:
+            return
+        self.kill_user(user, reason)
+
+    def introduce_remote_user(self, nickname, link, nick_ts):
+        if not self.resolve_nick_collision(link, nickname, nick_ts):
+            return False
+        self.nicknames.add(nickname)
+        self.users[nickname] = RemoteClient(nickname, link, nick_ts)
+        return True
+
+    def remote_nick(self, link, nickname, new_nickname, nick_ts):
+        user = self.get_remote_user(link, nickname)
+        if user is None:
+            return False
+        if not self.resolve_nick_collision(link, new_nickname, nick_ts):
+            # Killed on its own server under the new name, forget the old one here
+            self.forget_remote_user(user, "Nickname collision")
+            self.propagate(f":{nickname} QUIT :Nickname collision", exclude=link)
+            return False
+        self.nicknames.discard(nickname)
+        del self.users[nickname]
+        self.nicknames.add(new_nickname)
+        self.users[new_nickname] = user
+        user.nickname = new_nickname
+        user.nick_ts = nick_ts
+        return True
+
+    def remote_join(self, link, nickname, channel_name):
+        user = self.get_remote_user(link, nickname)
+        if user is None:
+            return
+        channel = self.channels.get_or_create(channel_name)
+        if user not in channel.members:
+            channel.join(user)
+            channel.broadcast(f":{nickname} JOIN {channel.name}")
+
+    def remote_part(self, link, nickname, channel_name):
+        user = self.get_remote_user(link, nickname)
+        channel = self.channels.get(channel_name)
+        if user is None or channel is None or user not in channel.members:
+            return
+        channel.broadcast(f":{nickname} PART {channel.name}")
+        channel.part(user)
+        self.channels.release(channel)
+
+    def remote_channel_message(self, link, nickname, channel_name, msg):
+        channel = self.channels.get(channel_name)
+        if channel is None:
+            return
+        priv_msg = f":{nickname} PRIVMSG {channel.name} :{msg}"
+        channel.broadcast(priv_msg)
+        self.propagate_to_channel(channel, priv_msg, exclude=link)
+
+    def remote_topic(self, source, channel_name, topic):
+        channel = self.channels.get(channel_name)
+        if channel is None:
+            return
+        channel.topic = topic
+        channel.broadcast(f":{source} TOPIC {channel.name} :{topic}")
+
+    def remote_mode(self, source, channel_name, mode, target):
+        channel = self.channels.get(channel_name)
+        if channel is None:
+            return
+        if mode == "+b":
+            channel.ban_user(target)
+        elif mode == "-b":
+            channel.unban_user(target)
+        elif mode == "+m":
+            channel.mute_user(target)
+        elif mode == "-m":
+            channel.unmute_user(target)
+        else:
+            return
+        channel.broadcast(format_mode_message(self.host, source, channel.name, mode, target))
+
+        # Banned users are parted by the server they are on, which tells the rest
+        target_client = self.users.get(target)
+        if mode == "+b" and target_client and target_client.link is None and target_client in channel.members:
+            self.part_channel(target_client, channel.name)
+
+    def remote_kick(self, source, channel_name, target_nickname):
+        channel = self.channels.get(channel_name)
+        target_client = self.users.get(target_nickname)
+        if channel is None or target_client not in channel.members:
+            return
+        channel.broadcast(f":{source} KICK {channel.name} {target_nickname} :Kicked by {source}")
+        channel.part(target_client)
+        self.channels.release(channel)
+
+        if target_client.link is None and target_client.nickname == self.bot_nickname:
+            print(f"Bot kicked from {channel_name}. Rejoining....")
+            self.join_channel(target_client, channel_name)
+
+    def remote_quit(self, link, nickname, reason):
+        user = self.get_remote_user(link, nickname)
+        if user is None:
+            return
+        self.forget_remote_user(user, reason)
+
+    def forget_remote_user(self, user, reason):
+        self.nicknames.discard(user.nickname)
+        del self.users[user.nickname]
+        for channel in list(self.channels.values()):
+            if user in channel.members:
+                channel.broadcast(f":{user.nickname} PART {channel.name} :{reason}")
+                channel.part(user)
+                self.channels.release(channel)
+
+    async def connect_link(self, host, port):
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError as e:
+            print(f"Could not link to {host}:{port}: {e}")
+            return
+        print(f"Linking to {host}:{port} ...")
+        await ServerLink(self, reader, writer).run(outgoing=True)
+
+    # Zero-downtime restart
+    #
+    # The running server waits on handover_path. A new process started with
+    # takeover_path pointing there receives the state, the listening socket
+    # and every client socket, and carries on serving them. Server links are
+    # not handed over; peers see a split and the new process links again.
+
+    async def wait_for_handover(self):
+        loop = asyncio.get_running_loop()
+        if os.path.exists(self.handover_path):
+            os.unlink(self.handover_path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.handover_path)
+        listener.listen(1)
+        listener.setblocking(False)
+        print(f"Waiting for a replacement process on {self.handover_path}")
+
+        while True:
+            conn, _ = await loop.sock_accept(listener)
+            started_at = time.time()
+            print("Replacement process connected, handing over")
+
+            # Stop accepting first, new connections wait in the listen backlog
+            # for whichever process serves next
+            listen_fd = self.accepting_server.sockets[0].fileno()
+            loop.remove_reader(listen_fd)
+            clients = [client for client in self.clients.values() if not client.writer.is_closing()]
+            for client in clients:
+                client.writer.transport.pause_reading()
+            pending = [client for client in clients if client.writer.transport.get_write_buffer_size()]
+            await asyncio.gather(*(asyncio.wait_for(client.writer.drain(), 5) for client in pending),
+                                 return_exceptions=True)
+
+            # Connections accepted just before we stopped have registered by
+            # now, take the list again
+            clients = [client for client in self.clients.values() if not client.writer.is_closing()]
+            for client in clients:
+                client.writer.transport.pause_reading()
+
+            # Nothing below yields to the event loop, so no client input is
+            # processed until we are done
+            conn.setblocking(True)
+            conn.settimeout(30)
+            try:
+                state, fds = self.snapshot_state(clients, started_at)
+                send_handover(conn, state, fds)
+            except (OSError, ValueError) as e:
+                print(f"Handover failed, continuing to serve: {e}")
+                conn.close()
+                for client in clients:
+                    if not client.writer.is_closing():
+                        client.writer.transport.resume_reading()
+                await self.resume_accepting(listen_fd)
+                continue
+
+            conn.close()
+            listener.close()
+            os.unlink(self.handover_path)
+            self.handed_over = True
+            print(f"Handed over {len(clients)} clients in {(time.time() - started_at) * 1000:.1f} ms, exiting")
+            if self.accepting_server is not self.server:
+                self.accepting_server.close()
+            self.server.close()
+            return
+
+    # Accepts on the listening socket again after a failed handover. A new
+    # asyncio server on a duplicate of the descriptor does the accepting, the
+    # original one stays so start() keeps waiting on it. The next handover
+    # stops and hands over whichever is accepting.
+    async def resume_accepting(self, listen_fd):
+        sock = socket.socket(fileno=os.dup(listen_fd))
+        previous = self.accepting_server
+        self.accepting_server = await asyncio.start_server(self.handle_client, sock=sock,
+                                                           backlog=self.listen_backlog)
+        if previous is not self.server:
+            previous.close()
+
+    def snapshot_state(self, clients, started_at):
+        handed_over = set(clients)
+        fds = [self.accepting_server.sockets[0].fileno()]
+        client_states = []
+        for addr, client in self.clients.items():
+            if client not in handed_over:
+                continue
+            fds.append(client.writer.get_extra_info('socket').fileno())
+            # Bytes already read from the socket but not yet a full line
+            buffered = bytes(client.reader._buffer) if client.reader else b""
+            client_states.append({
+                'addr': list(addr),
+                'nickname': client.nickname,
+                'username': client.username,
+                'nick_ts': client.nick_ts,
+                'buffer': base64.b64encode(buffered).decode(),
+            })
+
+        channel_states = []
+        for channel in self.channels.values():
+            members = [member.nickname for member in channel.members if member.link is None]
+            if not members:
+                continue
+            channel_states.append({
+                'name': channel.name,
+                'topic': channel.topic,
+                'banned': sorted(channel.banned_users),
+                'muted': sorted(channel.muted_users),
+                'members': members,
+            })
+
+        retained = {key: [sorted(banned), sorted(muted)] for key, (banned, muted) in self.channels.retained.items()}
+        state = {'started_at': started_at, 'clients': client_states, 'channels': channel_states,
+                 'retained': retained}
+        return state, fds
+
+    async def take_over(self):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(60)
+        conn.connect(self.takeover_path)
+        try:
+            state, fds = receive_handover(conn)
+        finally:
+            conn.close()
+
+        listen_sock = socket.socket(fileno=fds[0])
+        server = await asyncio.start_server(self.handle_client, sock=listen_sock, backlog=self.listen_backlog)
+
+        # Opened together so each connection does not cost an event loop turn
+        streams = await asyncio.gather(*(asyncio.open_connection(sock=socket.socket(fileno=fd)) for fd in fds[1:]))
+
+        restored = []
+        for client_state, (reader, writer) in zip(state['clients'], streams):
+            buffered = base64.b64decode(client_state['buffer'])
+            if buffered:
+                reader.feed_data(buffered)
+
+            addr = tuple(client_state['addr'])
+            client = Client(writer, client_state['nickname'], client_state['username'])
+            client.nick_ts = client_state.get('nick_ts') or state['started_at']
+            self.clients[addr] = client
+            self.admission.track(addr[0])
+            if client.nickname:
+                self.nicknames.add(client.nickname)
+                self.users[client.nickname] = client
+            restored.append((reader, client, addr))
+
+        for channel_state in state['channels']:
+            channel = self.channels.get_or_create(channel_state['name'])
+            channel.topic = channel_state['topic']
+            channel.banned_users = set(channel_state['banned'])
+            channel.muted_users = set(channel_state['muted'])
+            for nickname in channel_state['members']:
+                if nickname in self.users:
+                    channel.join(self.users[nickname])
+            self.channels.release(channel)
+
+        # Moderation state of empty registered channels
+        for key, (banned, muted) in state.get('retained', {}).items():
+            if key in self.channels.registered and key not in self.channels:
+                self.channels.retained[key] = (set(banned), set(muted))
+
+        for reader, client, addr in restored:
+            asyncio.create_task(self.serve_client(reader, client, addr))
+
+        print(f"Took over {len(restored)} clients and {len(self.channels)} channels, "
+              f"service paused for {(time.time() - state['started_at']) * 1000:.1f} ms")
+        return server
+
     async def start(self):
-        server = await asyncio.start_server(self.handle_client, self.host, self.port, family=socket.AF_INET6)
-        print(f'\nServing listening on {self.host}:{self.port} ...')
+        if self.takeover_path:
+            server = await self.take_over()
+            print(f'\nServing listening on {self.host}:{self.port} (taken over) ...')
+        else:
+            server = await asyncio.start_server(self.handle_client, self.host, self.port, family=socket.AF_INET6,
+                                                backlog=self.listen_backlog)
+            print(f'\nServing listening on {self.host}:{self.port} ...')
+        self.server = server
+        self.accepting_server = server
         asyncio.create_task(self.check_inactive_clients())
-        async with server:
+        if self.handover_path:
+            asyncio.create_task(self.wait_for_handover())
+        for host, port in self.link_addresses:
+            asyncio.create_task(self.connect_link(host, port))
+        try:
             await server.serve_forever()
+        except asyncio.CancelledError:
+            if not self.handed_over:
+                raise
+        finally:
+            # Not awaiting wait_closed, it would wait for client connections
+            # that now belong to the new process
+            server.close()
+            if self.capture:
+                self.capture.close()
+
+def normalise_address(host):
+    try:
+        address = ipaddress.ip_address(host.split('%', 1)[0])
+    except ValueError:
+        return host.lower()
+    if address.version == 6 and address.ipv4_mapped:
+        return address.ipv4_mapped
+    return address
+
+def parse_link_address(address):
+    host, _, port = address.rpartition(':')
+    return host.strip('[]'), int(port)
 
 if __name__ == "__main__":
-    server = Server()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='::1')
+    parser.add_argument('--port', type=int, default=6667)
+    parser.add_argument('--name', type=str)
+    parser.add_argument('--link', type=parse_link_address, action='append', default=[],
+                        help="host:port of a server to link to, may be repeated")
+    parser.add_argument('--link-password', type=str,
+                        help="password for server links, without one only --link peers may link in")
+    parser.add_argument('--backlog', type=int, default=128)
+    parser.add_argument('--max-connections', type=int, default=10000)
+    parser.add_argument('--max-per-ip', type=int, default=0, help="0 is no limit")
+    parser.add_argument('--max-per-subnet', type=int, default=0, help="0 is no limit")
+    parser.add_argument('--ip-rate', type=int, default=0, help="connections per IP per rate window, 0 is no limit")
+    parser.add_argument('--subnet-rate', type=int, default=0, help="connections per subnet per rate window, 0 is no limit")
+    parser.add_argument('--rate-window', type=int, default=10)
+    parser.add_argument('--registration-timeout', type=int, default=30)
+    parser.add_argument('--capture', type=str, help="record inbound client lines to this file for replay.py")
+    parser.add_argument('--handover-path', type=str, help="Unix socket a replacement process can take over from")
+    parser.add_argument('--takeover', type=str, help="take over from the server waiting on this Unix socket")
+    parser.add_argument('--register-channel', action='append', default=[],
+                        help="keep this channel's bans and mutes after it empties, may be repeated")
+
+    args = parser.parse_args()
+
+    admission = AdmissionControl(args.max_connections, args.max_per_ip, args.max_per_subnet,
+                                 args.ip_rate, args.subnet_rate, args.rate_window)
+    server = Server(args.host, args.port, args.name, args.link_password, args.link,
+                    admission, args.backlog, args.registration_timeout, args.capture,
+                    args.handover_path, args.takeover, args.register_channel)
     asyncio.run(server.start())
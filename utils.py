@@ -18,6 +18,22 @@ class NumericReplies(Enum):
     ERR_BANNEDFROMCHAN = "478"
     ERR_NOPRIVILEGES = "481"
     
+# Splits "[:source] COMMAND param ... [:trailing]" into its parts in one pass
+def parse_message(line):
+    source = None
+    if line.startswith(':'):
+        source, _, line = line[1:].partition(' ')
+    trailing = None
+    if ' :' in line:
+        line, trailing = line.split(' :', 1)
+    elif line.startswith(':'):
+        line, trailing = '', line[1:]
+    params = line.split()
+    command = params.pop(0).upper() if params else ''
+    if trailing is not None:
+        params.append(trailing)
+    return source, command, params
+
 def log_message(client, message):
     print(f"\nSent to <{client.nickname}>: {message.strip()}")
 
@@ -29,6 +45,10 @@ class Client:
         self.username = username
         self.banned_users = set()
         self.muted_users = set()
+        self.link = None
+        self.reader = None
+        # When the current nickname was taken, settles collisions between servers
+        self.nick_ts = None
 
     def send(self, message):
         log_message(self, message) 
@@ -42,6 +62,20 @@ class Client:
     def get_info(self):
         return f"{self.nickname} ({self.username})"
 
+# Class representing a user connected to another server in the network.
+# Messages sent to it are routed over the server link it was introduced on.
+class RemoteClient(Client):
+    def __init__(self, nickname, link, nick_ts=None):
+        super().__init__(None, nickname)
+        self.link = link
+        self.nick_ts = nick_ts
+
+    def send(self, message):
+        self.link.route(self.nickname, message)
+
+    def close(self):
+        pass
+
 # Class representing a channel
 class Channel:
     def __init__(self, name):
@@ -50,17 +84,33 @@ class Channel:
         self.topic = None
         self.banned_users = set()
         self.muted_users = set()
+        # Number of members reachable through each server link
+        self.link_members = {}
 
     def join(self, client):
+        if client in self.members:
+            return
         self.members.add(client)
+        if client.link is not None:
+            self.link_members[client.link] = self.link_members.get(client.link, 0) + 1
 
     def part(self, client):
+        if client not in self.members:
+            return
         self.members.discard(client)
+        if client.link is not None:
+            self.link_members[client.link] -= 1
+            if not self.link_members[client.link]:
+                del self.link_members[client.link]
 
+    # Only reaches local members, remote servers get the event over their link
     def broadcast(self, message, exclude=None):
         for client in self.members:
-            if client != exclude:
+            if client != exclude and client.link is None:
                 client.send(message)
+
+    def remote_links(self):
+        return self.link_members.keys()
     
     def ban_user(self, client):
         self.banned_users.add(client)
@@ -84,6 +134,67 @@ class Channel:
         return client in self.muted_users
 
 
+# RFC 1459 case mapping: besides A-Z, []\~ are the upper case of {}|^
+RFC1459_CASEMAP = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ[]\\~", "abcdefghijklmnopqrstuvwxyz{}|^")
+
+def irc_lower(name):
+    return name.translate(RFC1459_CASEMAP)
+
+# Channels keyed on their case-folded name. A channel lives while it has
+# members: release() drops it once the last one has left. Bans and mutes of
+# registered channels are kept across that and given back when the channel is
+# created again, every other channel is forgotten completely.
+class ChannelRegistry:
+    def __init__(self, registered=None):
+        self.channels = {}
+        self.registered = {irc_lower(name) for name in registered} if registered else set()
+        self.retained = {}
+
+    def get(self, name):
+        return self.channels.get(irc_lower(name))
+
+    def get_or_create(self, name):
+        key = irc_lower(name)
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = Channel(name)
+            retained = self.retained.pop(key, None)
+            if retained:
+                channel.banned_users, channel.muted_users = retained
+            self.channels[key] = channel
+        return channel
+
+    def release(self, channel):
+        if not channel.is_empty():
+            return False
+        key = irc_lower(channel.name)
+        if self.channels.get(key) is not channel:
+            return False
+        del self.channels[key]
+        if key in self.registered and (channel.banned_users or channel.muted_users):
+            self.retained[key] = (channel.banned_users, channel.muted_users)
+        return True
+
+    def register(self, name):
+        self.registered.add(irc_lower(name))
+
+    def unregister(self, name):
+        key = irc_lower(name)
+        self.registered.discard(key)
+        self.retained.pop(key, None)
+
+    def values(self):
+        return self.channels.values()
+
+    def __getitem__(self, name):
+        return self.channels[irc_lower(name)]
+
+    def __contains__(self, name):
+        return irc_lower(name) in self.channels
+
+    def __len__(self):
+        return len(self.channels)
+
 # Formatting messages
 
 def format_welcome_message(host, nick):